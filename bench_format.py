@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+import sys, time, random, argparse
+
+import pyisis
+import pyisis.config
+import pyisis.session
+from pyisis.engine import Engine
+from pyisis.records import MasterRecord
+
+"""
+
+Benchmark of the formatting language over synthetic records,
+stressing the cases where the cost depends on the size of the data.
+
+"""
+
+DEFAULT_SIZES = '4,16,64'
+DEFAULT_OCCS = '100,1000'
+DEFAULT_REPEAT = 3
+
+def make_text(size, seed=0):
+    """Return a text of about size characters made of random words."""
+    rnd = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz')
+                       for i in range(rnd.randint(1, 12)))
+        words.append(word)
+        length += len(word) + 1
+    return u' '.join(words)[:size]
+
+def timeit(expr, record, repeat):
+    """Best wall time (in seconds) of formatting record with expr."""
+    # first run compiles the expression
+    pyisis.session.format(expr, record)
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        pyisis.session.format(expr, record)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_long_fields(config, sizes, repeat, output):
+    """Proof mode formatting of a single multi-KB field, which is
+    broken into lines of MAX_LINE_WIDTH characters."""
+    exprs = ['v1', 'mpl,v1/', "mpl,'Abstract: 'v1,x1,v2"]
+    output.write('long fields (proof mode, width=%d)\n' % config.MAX_LINE_WIDTH)
+    for size in sizes:
+        record = MasterRecord(mfn=1, config=config,
+                              fields={1: make_text(size * 1024, size),
+                                      2: u'end'})
+        for expr in exprs:
+            elapsed = timeit(expr, record, repeat)
+            output.write('  %5d KB  %-28s %9.2f ms\n' % (size, expr, elapsed * 1000))
+
+def bench_occurrences(config, counts, repeat, output):
+    """Repeatable groups over a field with many occurrences,
+    like long author or keyword lists."""
+    exprs = ['(v70/)', "(v70+|; |)", "mdl,(v70^a,c30,v70^b/)",
+             "(if iocc>1 then ', ' fi,v70)"]
+    output.write('repeated fields (occurrences of v70)\n')
+    for count in counts:
+        occs = [u'^a%s^b%d' % (make_text(20, i).upper(), i)
+                for i in range(count)]
+        record = MasterRecord(mfn=1, config=config, fields={70: occs})
+        for expr in exprs:
+            elapsed = timeit(expr, record, repeat)
+            output.write('  %5d     %-28s %9.2f ms\n' % (count, expr, elapsed * 1000))
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Benchmark the formatting language over synthetic records')
+
+    # add the arguments
+    parser.add_argument(
+        '-s', '--sizes', default=DEFAULT_SIZES, metavar='KB[,KB...]',
+        help='comma separated sizes of the long fields in KB '
+             '(default=%s)' % DEFAULT_SIZES)
+    parser.add_argument(
+        '-o', '--occs', default=DEFAULT_OCCS, metavar='N[,N...]',
+        help='comma separated number of occurrences of the repeated field '
+             '(default=%s)' % DEFAULT_OCCS)
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+        help='runs of each case, the best one is reported '
+             '(default=%d)' % DEFAULT_REPEAT)
+
+    # parse the command line
+    args = parser.parse_args()
+    config = pyisis.config.config
+    Engine.setup(config)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    counts = [int(count) for count in args.occs.split(',') if count]
+    bench_long_fields(config, sizes, args.repeat, sys.stdout)
+    bench_occurrences(config, counts, args.repeat, sys.stdout)
@@ -1,6 +1,6 @@
-./pyisis2json.py isis/cds.mst -m -n >cds.json
+./pyisis2json.py isis/cds.mst -m -n -x index.json >cds.json
 mongoimport -d bireme -c cds --drop --file cds.json
-./isis-mongo-index.py
+./isis-mongo-index.py --drop -f index.json
 
 #teste de pesquisa
 ./test_search.py "MEASUREMENT AND INSTRUMENTS"
@@ -9,4 +9,7 @@ mongoimport -d bireme -c cds --drop --file cds.json
 ./test_search.py "MEASUREMENT AND INSTRUMENTS" 69
 
 #teste de pesquisa simulando o dicionario do winisis
-./test_search_suggest.py "MEAS"
\ No newline at end of file
+./test_search_suggest.py "MEAS"
+#carga alternativa em BSON, sem o parse do JSON pelo mongoimport
+#./pyisis2json.py isis/cds.mst -B -n -x index.json -o cds.bson
+#mongorestore -d bireme -c cds --drop cds.bson
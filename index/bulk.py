@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk writer of index keys into the index collection,
+which also keeps the terms collection up to date.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import sys
+import json
+from time import time
+from itertools import groupby
+from operator import itemgetter
+
+from multiprocessing import Pool
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from index.techniques import document_keys
+from index.terms import add_terms, remove_terms, ensure_terms_index, \
+     DUPLICATE_KEY
+
+DEFAULT_BATCH_SIZE = 5000
+
+KEY_INDEX = [('cds_id', ASCENDING), ('field', ASCENDING), ('text', ASCENDING)]
+
+
+def ensure_key_index(collection):
+    """Create the unique index (cds_id, field, text) that
+    keeps the index collection free of repeated keys."""
+    collection.create_index(KEY_INDEX, unique=True, name='cds_id_field_text')
+
+
+class BulkIndexer(object):
+    """Collects the keys of the indexed documents in memory and writes
+    them to the index collection in batches.
+
+    Keys are kept in a dict, so repeated keys of a batch are written
+    once, and batches are only flushed between documents. Since keys
+    include the cds_id, a batch never repeats a key written by a
+    previous batch of the same run.
+
+    With fresh=True the collection is expected to hold no keys of the
+    indexed documents and batches are inserted with insert_many;
+    otherwise each key is upserted, leaving existing keys untouched.
+    Both are unordered, so one failed key does not stop the batch.
+
+    If terms is given, the keys actually written are counted in
+    that terms collection.
+    """
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE,
+                 fresh=False, output=sys.stderr, report_every=10.0, name='',
+                 terms=None):
+        self.collection = collection
+        self.terms = terms
+        self.name = name
+        self.batch_size = batch_size
+        self.fresh = fresh
+        self.output = output
+        self.report_every = report_every
+        self.pending = {}
+        self.documents = 0
+        self.keys = 0
+        self.written = 0
+        self.start = self.last_report = time()
+
+    def add(self, document):
+        """Extract the keys of the document, flushing them
+        if the batch is full."""
+        self.add_keys(document_keys(document))
+
+    def add_keys(self, keys):
+        """Add the keys (cds_id, field, text, tf, length) of one
+        document, flushing them if the batch is full."""
+        for id, field, text, tf, length in keys:
+            self.pending[(id, field, text)] = (tf, length)
+        self.documents += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending keys to the collection."""
+        if not self.pending:
+            return
+        keys = [key + value for key, value in self.pending.iteritems()]
+        docs = [{'cds_id': id, 'field': field, 'text': text,
+                 'tf': tf, 'length': length}
+                for id, field, text, tf, length in keys]
+        self.keys += len(docs)
+        self.pending = {}
+        try:
+            if self.fresh:
+                self.collection.insert_many(docs, ordered=False)
+                new = keys
+            else:
+                requests = [UpdateOne({'cds_id': doc['cds_id'],
+                                       'field': doc['field'],
+                                       'text': doc['text']},
+                                      {'$setOnInsert': doc}, upsert=True)
+                            for doc in docs]
+                result = self.collection.bulk_write(requests, ordered=False)
+                new = [keys[idx] for idx in result.upserted_ids]
+        except BulkWriteError, ex:
+            # keys already in the collection are not an error
+            errors = [error for error in ex.details['writeErrors']
+                      if error['code'] != DUPLICATE_KEY]
+            if errors:
+                raise
+            if self.fresh:
+                failed = set(error['index']
+                             for error in ex.details['writeErrors'])
+                new = [key for idx, key in enumerate(keys) if idx not in failed]
+            else:
+                new = [keys[upserted['index']]
+                       for upserted in ex.details['upserted']]
+        self.written += len(new)
+        if self.terms is not None:
+            add_terms(self.terms, new, new_fields(keys, new))
+        if time() - self.last_report >= self.report_every:
+            self.report()
+
+    def close(self):
+        """Flush the last batch and write the final report."""
+        self.flush()
+        self.report()
+
+    def elapsed(self):
+        return max(time() - self.start, 1e-6)
+
+    def report(self):
+        """Write the progress and the throughput to the output."""
+        self.last_report = time()
+        if self.output is None:
+            return
+        elapsed = self.elapsed()
+        if self.name:
+            self.output.write('%s: ' % self.name)
+        self.output.write('%d documents, %d keys (%d new) in %.1fs: '
+                          '%.0f documents/s, %.0f keys/s\n' % \
+                          (self.documents, self.keys, self.written, elapsed,
+                           self.documents / elapsed, self.keys / elapsed))
+        self.output.flush()
+
+
+def new_fields(keys, new):
+    """Return the fields (cds_id, field, length) whose keys
+    are all new, that is, the fields indexed for the first time."""
+    left = {}
+    for key in keys:
+        left[key[:2]] = left.get(key[:2], 0) + 1
+    lengths = {}
+    for key in new:
+        left[key[:2]] -= 1
+        lengths[key[:2]] = key[4]
+    return [field + (lengths[field],)
+            for field, count in left.iteritems() if not count]
+
+
+def key_tuple(key):
+    """Return the tuple (cds_id, field, text, tf, length) of a document
+    of the index collection. Keys written before tf and length were
+    stored count once."""
+    return (key['cds_id'], key['field'], key['text'],
+            key.get('tf', 1), key.get('length', 1))
+
+
+def load_keys(stream):
+    """Generate the lists of keys of each document from a file
+    written by pyisis2json.py --index-out."""
+    def parse():
+        for line in stream:
+            if line.strip():
+                yield key_tuple(json.loads(line))
+    for id, keys in groupby(parse(), itemgetter(0)):
+        yield list(keys)
+
+
+def index_file(stream, target, batch_size=DEFAULT_BATCH_SIZE,
+               fresh=False, output=sys.stderr, terms=None):
+    """Write the keys read from a file written by pyisis2json.py
+    --index-out into target, counting them in terms if given.
+    Return the BulkIndexer used.
+    """
+    ensure_key_index(target)
+    if terms is not None:
+        ensure_terms_index(terms)
+    indexer = BulkIndexer(target, batch_size, fresh, output, terms=terms)
+    for keys in load_keys(stream):
+        indexer.add_keys(keys)
+    indexer.close()
+    return indexer
+
+
+def index_collection(source, target, batch_size=DEFAULT_BATCH_SIZE,
+                     fresh=False, output=sys.stderr, terms=None):
+    """Index every document of the source collection into target,
+    counting the keys in terms if given.
+    Return the BulkIndexer used, holding the counters of the run.
+    """
+    ensure_key_index(target)
+    if terms is not None:
+        ensure_terms_index(terms)
+    indexer = BulkIndexer(target, batch_size, fresh, output, terms=terms)
+    for document in source.find({}, batch_size=1000):
+        indexer.add(document)
+    indexer.close()
+    return indexer
+
+
+def partition_bounds(collection, parts):
+    """Split the _id range of the collection into at most parts
+    ranges holding about the same number of documents.
+    Return the list of (lower, upper) bounds, where lower is
+    inclusive, upper is exclusive and None means unbounded.
+    """
+    count = collection.estimated_document_count()
+    ids = collection.find({}, {'_id': 1}).sort('_id', ASCENDING)
+    splits = []
+    for part in range(1, parts):
+        for doc in ids.clone().skip(part * count // parts).limit(1):
+            if not splits or doc['_id'] != splits[-1]:
+                splits.append(doc['_id'])
+    lowers = [None] + splits
+    uppers = splits + [None]
+    return zip(lowers, uppers)
+
+
+def id_range_query(lower, upper):
+    """Query of the documents with lower <= _id < upper."""
+    query = {}
+    if lower is not None:
+        query['$gte'] = lower
+    if upper is not None:
+        query['$lt'] = upper
+    if query:
+        return {'_id': query}
+    return {}
+
+
+def index_partition(task):
+    """Index the documents of one _id range in a worker process,
+    using its own connection. Return the tuple
+    (name, documents, keys, written, elapsed).
+    """
+    host, port, dbname, (lower, upper), batch_size, fresh, terms, name = task
+    db = MongoClient(host, port)[dbname]
+    if terms is not None:
+        terms = db[terms]
+    indexer = BulkIndexer(db.index, batch_size, fresh, sys.stderr, name=name,
+                          terms=terms)
+    for document in db.cds.find(id_range_query(lower, upper), batch_size=1000):
+        indexer.add(document)
+    indexer.close()
+    return (name, indexer.documents, indexer.keys, indexer.written,
+            indexer.elapsed())
+
+
+def index_parallel(host, port, dbname, workers, batch_size=DEFAULT_BATCH_SIZE,
+                   fresh=False, output=sys.stderr, terms=None):
+    """Index the cds collection into the index collection with a pool
+    of worker processes, each one indexing a range of _id values.
+    If terms is given, the keys are counted in the collection with
+    that name. Return the list of results of index_partition for
+    each range.
+    """
+    db = MongoClient(host, port)[dbname]
+    ensure_key_index(db.index)
+    if terms is not None:
+        ensure_terms_index(db[terms])
+    bounds = partition_bounds(db.cds, workers)
+    # workers open their own connections after the fork
+    db.client.close()
+    tasks = [(host, port, dbname, bound, batch_size, fresh, terms,
+              'worker %d' % idx)
+             for idx, bound in enumerate(bounds)]
+    start = time()
+    pool = Pool(workers)
+    try:
+        results = pool.map(index_partition, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = max(time() - start, 1e-6)
+    if output is not None:
+        for name, documents, keys, written, seconds in results:
+            output.write('%s: %d documents, %d keys, %.0f documents/s\n' % \
+                         (name, documents, keys, documents / seconds))
+        documents = sum(result[1] for result in results)
+        keys = sum(result[2] for result in results)
+        output.write('total: %d documents, %d keys in %.1fs: '
+                     '%.0f documents/s, %.0f keys/s\n' % \
+                     (documents, keys, elapsed,
+                      documents / elapsed, keys / elapsed))
+    return results
+
+
+def remove_documents(collection, ids, terms=None):
+    """Remove the keys of the documents with the given cds_id from
+    the index collection, discounting them in terms if given.
+    Return the number of keys removed.
+    """
+    query = {'cds_id': {'$in': list(ids)}}
+    keys = [key_tuple(key) for key in collection.find(query, {'_id': False})]
+    collection.delete_many(query)
+    if terms is not None:
+        remove_terms(terms, keys, new_fields(keys, keys))
+    return len(keys)
+
+
+def count_terms(collection, terms, batch_size=DEFAULT_BATCH_SIZE):
+    """Rebuild the terms collection from the keys already in the
+    index collection. Return the number of keys counted."""
+    terms.drop()
+    ensure_terms_index(terms)
+    count = 0
+    batch = []
+    keys = collection.find({}, {'_id': False}, batch_size=1000).sort(KEY_INDEX)
+    # batches end between documents, like the batches of BulkIndexer
+    for id, keys_of_document in groupby(keys, itemgetter('cds_id')):
+        batch.extend(key_tuple(key) for key in keys_of_document)
+        if len(batch) >= batch_size:
+            add_terms(terms, batch, new_fields(batch, batch))
+            count += len(batch)
+            batch = []
+    add_terms(terms, batch, new_fields(batch, batch))
+    return count + len(batch)
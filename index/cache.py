@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of search results.
+
+Results are kept in memory in a LRU cache with a time to live, and
+dropped as a whole whenever the generation of the index changes. The
+generation is a counter kept in the meta collection, bumped by the
+indexer after each reload of the index.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import threading
+from time import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+from index.search import search, normalize_term, DEFAULT_PAGE_SIZE
+
+DEFAULT_CACHE_SIZE = 1000
+# Seconds a result is kept
+DEFAULT_TTL = 300.0
+# Seconds between reads of the generation of the index
+DEFAULT_CHECK_EVERY = 1.0
+
+GENERATION_ID = 'generation'
+
+
+def read_generation(db):
+    """Return the generation of the index (0 if never bumped)."""
+    found = db.meta.find_one({'_id': GENERATION_ID})
+    if found is None:
+        return 0
+    return found['value']
+
+
+def bump_generation(db):
+    """Start a new generation of the index, invalidating the results
+    cached by every process. Return the new generation."""
+    found = db.meta.find_one_and_update({'_id': GENERATION_ID},
+                                        {'$inc': {'value': 1}}, upsert=True,
+                                        return_document=ReturnDocument.AFTER)
+    return found['value']
+
+
+class LRUCache(object):
+    """Thread safe mapping keeping at most max_size values, each one
+    for ttl seconds, dropping the least recently used first."""
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the value of key, or None if not cached or expired."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] < time():
+                self.misses += 1
+                return None
+            # moved to the end, the most recently used
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time() + self.ttl, value)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SearchCache(object):
+    """Search of the index in front of an LRUCache, keyed by
+    (term, field, skip, limit). The cache is cleared when the
+    generation of the index changes, which is read from the database
+    at most once every check_every seconds.
+
+    The cached lists of documents are shared, callers must not
+    modify them.
+    """
+    def __init__(self, db, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL,
+                 check_every=DEFAULT_CHECK_EVERY, page_size=DEFAULT_PAGE_SIZE):
+        self.db = db
+        self.cache = LRUCache(max_size, ttl)
+        self.check_every = check_every
+        self.page_size = page_size
+        self.generation = None
+        self.checked = 0.0
+
+    def check_generation(self):
+        """Clear the cache if the generation of the index changed."""
+        now = time()
+        if now - self.checked < self.check_every:
+            return
+        self.checked = now
+        generation = read_generation(self.db)
+        if generation != self.generation:
+            self.cache.clear()
+            self.generation = generation
+
+    def search(self, term, field=None, skip=0, limit=0):
+        """Return the list of documents found by index.search.search."""
+        self.check_generation()
+        key = (normalize_term(term), field, skip, limit)
+        documents = self.cache.get(key)
+        if documents is None:
+            generation = self.generation
+            documents = list(search(self.db, term, field,
+                                    self.page_size, skip, limit))
+            # results read while the generation changed may be stale
+            if generation == self.generation:
+                self.cache.put(key, documents)
+        return documents
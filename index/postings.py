@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Build of the postings collection, the compact form of the index
+collection, and comparison of both.
+
+The index collection holds a document per key (cds_id, field, text).
+The postings collection holds a document per chunk of at most
+CHUNK_SIZE cds_id of each (text, field), in increasing order:
+
+    {'text': 'MEASUREMENT', 'field': '69', 'first': 3, 'ids': [3, 8, ...]}
+
+so a text repeated in many documents is stored once per chunk.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import sys
+from time import time
+from itertools import groupby
+from operator import itemgetter
+
+from pymongo import DESCENDING
+
+from index.search import search_ids, search_postings_ids, \
+     ensure_postings_index, FIELD_TEXT_INDEX
+from index.terms import ALL_FIELDS
+
+CHUNK_SIZE = 1000
+# Chunks written per request
+INSERT_BATCH = 500
+
+
+def build_postings(index, postings, chunk_size=CHUNK_SIZE, output=sys.stderr):
+    """Rebuild the postings collection from the keys of the index
+    collection, read in (field, text, cds_id) order. Return the
+    number of chunks written."""
+    postings.drop()
+    keys = index.find({}, {'_id': False, 'cds_id': True, 'field': True,
+                           'text': True}, batch_size=5000)
+    chunks = []
+    written = 0
+    start = time()
+    for (field, text), group in groupby(keys.sort(FIELD_TEXT_INDEX),
+                                        itemgetter('field', 'text')):
+        ids = [key['cds_id'] for key in group]
+        for idx in range(0, len(ids), chunk_size):
+            chunk = ids[idx:idx+chunk_size]
+            chunks.append({'text': text, 'field': field, 'first': chunk[0],
+                           'ids': chunk})
+        if len(chunks) >= INSERT_BATCH:
+            postings.insert_many(chunks, ordered=False)
+            written += len(chunks)
+            chunks = []
+    if chunks:
+        postings.insert_many(chunks, ordered=False)
+        written += len(chunks)
+    ensure_postings_index(postings)
+    if output is not None:
+        output.write('%d chunks written in %.1fs\n' % (written, time() - start))
+    return written
+
+
+def storage_stats(db, name):
+    """Return the dict (count, size, storage, indexes) of the sizes
+    in bytes of a collection."""
+    stats = db.command('collstats', name)
+    return {'count': stats.get('count', 0), 'size': stats.get('size', 0),
+            'storage': stats.get('storageSize', 0),
+            'indexes': stats.get('totalIndexSize', 0)}
+
+
+def sample_terms(db, count):
+    """Return the count texts with most keys from the terms collection."""
+    found = db.terms.find({'field': ALL_FIELDS}, {'_id': False, 'text': True})
+    return [term['text'] for term in
+            found.sort('count', DESCENDING).limit(count)]
+
+
+def time_ids(read, repeat):
+    """Return the median time in seconds of reading every cds_id
+    given by read()."""
+    times = []
+    for _ in range(repeat):
+        start = time()
+        for id in read():
+            pass
+        times.append(time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def compare(db, count=20, repeat=5, output=sys.stdout):
+    """Write the sizes of the index and postings collections and the
+    median times of searching the most frequent texts in each one."""
+    output.write('%-10s %10s %12s %12s %12s\n' % \
+                 ('collection', 'documents', 'data', 'storage', 'indexes'))
+    for name in ('index', 'postings'):
+        stats = storage_stats(db, name)
+        output.write('%-10s %10d %12d %12d %12d\n' % \
+                     (name, stats['count'], stats['size'], stats['storage'],
+                      stats['indexes']))
+    output.write('\n%-30s %8s %10s %10s\n' % ('text', 'keys', 'index ms',
+                                             'postings ms'))
+    totals = [0.0, 0.0]
+    for text in sample_terms(db, count):
+        keys = len(list(search_ids(db, text)))
+        index_time = time_ids(lambda: search_ids(db, text), repeat)
+        postings_time = time_ids(lambda: search_postings_ids(db, text), repeat)
+        totals[0] += index_time
+        totals[1] += postings_time
+        output.write('%-30s %8d %10.2f %10.2f\n' % \
+                     (text[:30], keys, index_time * 1000,
+                      postings_time * 1000))
+    output.write('%-30s %8s %10.2f %10.2f\n' % \
+                 ('total', '', totals[0] * 1000, totals[1] * 1000))
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+
+"""
+Boolean searches of the index collection, in the syntax of CDS/ISIS:
+
+    MEASUREMENT * INSTRUMENTS/(69)
+    (TEMPERATURE + PRESSURE) ^ SURVEY
+    MEAS$/(24,69)
+
+where * is AND, + is OR, ^ is AND NOT, /(tags) restricts a term or a
+parenthesized query to some fields and $ at the end of a term searches
+every key starting with it. * and ^ bind tighter than +.
+
+Queries are run over streams of cds_id in increasing order, read from
+the index collection a batch at a time. AND is a leapfrog intersection:
+each stream seeks to the largest cds_id seen so far, which reads a new
+batch only when the cds_id is past the batch read, so its cost is
+bounded by the shortest stream rather than by the longest one.
+With compact=True the streams are read from the chunks of the postings
+collection instead of the index collection.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import re
+from bisect import bisect_left
+
+from pymongo import ASCENDING, DESCENDING
+
+from index.search import iter_terms, prefix_bounds, fetch_documents, \
+     normalize_term, search_postings_ids, DEFAULT_PAGE_SIZE
+from index.terms import ALL_FIELDS
+from index.ranking import MERGE_LIMIT
+
+# cds_id read by each query of a stream
+POSTINGS_BATCH = 1000
+
+token_pat = re.compile(r'\s*(?:(?P<op>[*+^()])|'
+                       r'/\(\s*(?P<fields>[^)]*)\)|'
+                       r'"(?P<quoted>[^"]*)"|'
+                       r'(?P<term>(?:[^*+^()/"]|/(?!\())+))')
+
+
+class QueryError(Exception):
+    """Invalid boolean query."""
+
+
+class Term(object):
+    def __init__(self, text, prefix=False, fields=None):
+        self.text = text
+        self.prefix = prefix
+        self.fields = fields
+
+    def __repr__(self):
+        return 'Term(%r, %r, %r)' % (self.text, self.prefix, self.fields)
+
+
+class Operation(object):
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = operands
+
+    def __repr__(self):
+        return 'Operation(%r, %r)' % (self.operator, self.operands)
+
+
+def tokenize(query):
+    """Return the list of tokens (kind, value) of the query."""
+    tokens = []
+    pos = 0
+    query = query.rstrip()
+    while pos < len(query):
+        match = token_pat.match(query, pos)
+        if match is None or match.end() == pos:
+            raise QueryError('invalid query at %r' % query[pos:])
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'term':
+            value = value.strip()
+            if not value:
+                continue
+        elif kind == 'fields':
+            value = [tag.strip() for tag in value.split(',') if tag.strip()]
+            if not value:
+                raise QueryError('empty field qualifier')
+        tokens.append((kind, value))
+    return tokens
+
+
+class Parser(object):
+    """Recursive descent parser of the boolean queries."""
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise QueryError('unexpected %r' % (self.peek()[1],))
+        return node
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == ('op', '+'):
+            self.take()
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return Operation('+', operands)
+
+    def parse_and(self):
+        node = self.parse_unary()
+        while self.peek() in (('op', '*'), ('op', '^')):
+            operator = self.take()[1]
+            node = Operation(operator, [node, self.parse_unary()])
+        return node
+
+    def parse_unary(self):
+        kind, value = self.take()
+        if kind == 'op' and value == '(':
+            node = self.parse_or()
+            if self.take() != ('op', ')'):
+                raise QueryError('missing )')
+        elif kind in ('term', 'quoted'):
+            prefix = kind == 'term' and value.endswith('$')
+            if prefix:
+                value = value[:-1]
+            node = Term(normalize_term(value).strip(), prefix)
+        elif kind is None:
+            raise QueryError('unexpected end of query')
+        else:
+            raise QueryError('unexpected %r' % (value,))
+        if self.peek()[0] == 'fields':
+            restrict(node, self.take()[1])
+        return node
+
+
+def restrict(node, fields):
+    """Restrict the terms of node without a qualifier to fields."""
+    if isinstance(node, Term):
+        if node.fields is None:
+            node.fields = fields
+    else:
+        for operand in node.operands:
+            restrict(operand, fields)
+
+
+def parse_query(query):
+    """Return the tree of Term and Operation of the query."""
+    if type(query) is not unicode:
+        query = query.decode('utf-8')
+    return Parser(query).parse()
+
+
+class Postings(object):
+    """Stream of cds_id in increasing order. current is the cds_id
+    at the position of the stream, meaningful while done is False.
+    Subclasses implement advance(), moving to the next cds_id, and
+    seek(target), moving to the first cds_id not lower than target."""
+    current = None
+    done = False
+    estimate = 0
+
+    def __iter__(self):
+        while not self.done:
+            yield self.current
+            self.advance()
+
+
+class KeyPostings(Postings):
+    """cds_id of the keys matching a query of the index collection,
+    read POSTINGS_BATCH at a time."""
+    def __init__(self, collection, query, estimate,
+                 batch_size=POSTINGS_BATCH):
+        self.collection = collection
+        self.query = query
+        self.estimate = estimate
+        self.batch_size = batch_size
+        self.fetch(None, False)
+
+    def fetch(self, lower, inclusive):
+        query = dict(self.query)
+        if lower is not None:
+            query['cds_id'] = {inclusive and '$gte' or '$gt': lower}
+        cursor = self.collection.find(query, {'_id': False, 'cds_id': True})
+        ids = [key['cds_id'] for key in
+               cursor.sort('cds_id').limit(self.batch_size)]
+        self.last_batch = len(ids) < self.batch_size
+        # a document has a key in several fields
+        self.buffer = [id for idx, id in enumerate(ids)
+                       if not idx or id != ids[idx-1]]
+        self.pos = 0
+        self.update()
+
+    def update(self):
+        if self.pos < len(self.buffer):
+            self.current = self.buffer[self.pos]
+        elif self.last_batch:
+            self.done = True
+        else:
+            self.fetch(self.buffer[-1], False)
+
+    def advance(self):
+        self.pos += 1
+        self.update()
+
+    def seek(self, target):
+        if self.done or self.current >= target:
+            return
+        if target <= self.buffer[-1]:
+            self.pos = bisect_left(self.buffer, target, self.pos)
+            self.update()
+        elif self.last_batch:
+            self.done = True
+        else:
+            self.fetch(target, True)
+
+
+class ChunkPostings(Postings):
+    """cds_id of a (text, field) of the postings collection,
+    read a chunk at a time."""
+    def __init__(self, collection, query, estimate):
+        self.collection = collection
+        self.query = query
+        self.estimate = estimate
+        self.load(self.find_chunk(None, ASCENDING))
+
+    def find_chunk(self, first, direction):
+        query = dict(self.query)
+        if first is not None:
+            query['first'] = first
+        cursor = self.collection.find(query, {'_id': False, 'first': True,
+                                              'ids': True})
+        for chunk in cursor.sort('first', direction).limit(1):
+            return chunk
+        return None
+
+    def load(self, chunk, target=None):
+        if chunk is None:
+            self.done = True
+            return
+        self.first = chunk['first']
+        self.buffer = chunk['ids']
+        self.pos = 0
+        if target is not None:
+            self.pos = bisect_left(self.buffer, target)
+        self.current = self.buffer[self.pos]
+
+    def advance(self):
+        self.pos += 1
+        if self.pos < len(self.buffer):
+            self.current = self.buffer[self.pos]
+        else:
+            self.load(self.find_chunk({'$gt': self.first}, ASCENDING))
+
+    def seek(self, target):
+        if self.done or self.current >= target:
+            return
+        if target <= self.buffer[-1]:
+            self.pos = bisect_left(self.buffer, target, self.pos)
+            self.current = self.buffer[self.pos]
+            return
+        # the chunk holding target, if any, is the last one
+        # starting before it
+        chunk = self.find_chunk({'$lte': target}, DESCENDING)
+        if chunk is None or chunk['ids'][-1] < target:
+            chunk = self.find_chunk({'$gt': target}, ASCENDING)
+        self.load(chunk, target)
+
+
+class ListPostings(Postings):
+    """cds_id of a sorted list."""
+    def __init__(self, ids):
+        self.ids = ids
+        self.estimate = len(ids)
+        self.pos = 0
+        self.update()
+
+    def update(self):
+        if self.pos < len(self.ids):
+            self.current = self.ids[self.pos]
+        else:
+            self.done = True
+
+    def advance(self):
+        self.pos += 1
+        self.update()
+
+    def seek(self, target):
+        if not self.done and self.current < target:
+            self.pos = bisect_left(self.ids, target, self.pos)
+            self.update()
+
+
+class OrPostings(Postings):
+    def __init__(self, operands):
+        self.operands = operands
+        self.estimate = sum(operand.estimate for operand in operands)
+        self.update()
+
+    def update(self):
+        currents = [operand.current for operand in self.operands
+                    if not operand.done]
+        if currents:
+            self.current = min(currents)
+        else:
+            self.done = True
+
+    def advance(self):
+        current = self.current
+        for operand in self.operands:
+            if not operand.done and operand.current == current:
+                operand.advance()
+        self.update()
+
+    def seek(self, target):
+        for operand in self.operands:
+            operand.seek(target)
+        self.update()
+
+
+class AndPostings(Postings):
+    """Leapfrog intersection of the operands."""
+    def __init__(self, operands):
+        self.operands = sorted(operands, key=lambda operand: operand.estimate)
+        self.estimate = self.operands[0].estimate
+        self.search()
+
+    def search(self):
+        """Move the operands to the next cds_id found in all of them."""
+        operands = self.operands
+        if [operand for operand in operands if operand.done]:
+            self.done = True
+            return
+        highest = max(operand.current for operand in operands)
+        agreed = 0
+        idx = 0
+        while agreed < len(operands):
+            operand = operands[idx]
+            operand.seek(highest)
+            if operand.done:
+                self.done = True
+                return
+            if operand.current == highest:
+                agreed += 1
+            else:
+                highest = operand.current
+                agreed = 1
+            idx = (idx + 1) % len(operands)
+        self.current = highest
+
+    def advance(self):
+        # the shortest operand moves first
+        self.operands[0].advance()
+        self.search()
+
+    def seek(self, target):
+        if self.done or self.current >= target:
+            return
+        self.operands[0].seek(target)
+        self.search()
+
+
+class NotPostings(Postings):
+    """cds_id of included not found in excluded."""
+    def __init__(self, included, excluded):
+        self.included = included
+        self.excluded = excluded
+        self.estimate = included.estimate
+        self.skip()
+
+    def skip(self):
+        included = self.included
+        excluded = self.excluded
+        while not included.done:
+            excluded.seek(included.current)
+            if excluded.done or excluded.current != included.current:
+                self.current = included.current
+                return
+            included.advance()
+        self.done = True
+
+    def advance(self):
+        self.included.advance()
+        self.skip()
+
+    def seek(self, target):
+        self.included.seek(target)
+        self.skip()
+
+
+def term_postings(db, term, batch_size=POSTINGS_BATCH, compact=False):
+    """Return the Postings of a Term."""
+    fields = term.fields or [ALL_FIELDS]
+    if term.prefix:
+        texts = {}
+        for field in fields:
+            for text, count in iter_terms(db, term.text, field or None,
+                                          prefix=True, page_size=1000):
+                texts[text] = texts.get(text, 0) + count
+    else:
+        counts = [found['count'] for found in
+                  db.terms.find({'field': {'$in': fields}, 'text': term.text},
+                                {'count': True})]
+        texts = {term.text: sum(counts)}
+    if compact:
+        return chunk_postings(db, term, texts)
+    query = {}
+    if term.fields:
+        query['field'] = {'$in': term.fields}
+    if term.prefix and (not texts or len(texts) > MERGE_LIMIT):
+        query['text'] = prefix_bounds(term.text)
+        return KeyPostings(db.index, query, sum(texts.values()), batch_size)
+    streams = []
+    for text, count in sorted(texts.items()):
+        text_query = dict(query)
+        text_query['text'] = text
+        streams.append(KeyPostings(db.index, text_query, count, batch_size))
+    if len(streams) == 1:
+        return streams[0]
+    return OrPostings(streams)
+
+
+def chunk_postings(db, term, texts):
+    """Return the Postings of a Term read from the postings collection,
+    texts mapping the texts of the term to their number of keys."""
+    if term.prefix and (not texts or len(texts) > MERGE_LIMIT):
+        ids = set()
+        for field in term.fields or [None]:
+            ids.update(search_postings_ids(db, term.text, field))
+        return ListPostings(sorted(ids))
+    streams = []
+    for text, count in sorted(texts.items()):
+        fields = term.fields or db.postings.distinct('field', {'text': text})
+        for field in fields:
+            streams.append(ChunkPostings(db.postings,
+                                         {'text': text, 'field': field}, count))
+    if len(streams) == 1:
+        return streams[0]
+    return OrPostings(streams)
+
+
+def postings(db, node, batch_size=POSTINGS_BATCH, compact=False):
+    """Return the Postings of a parsed query."""
+    if isinstance(node, Term):
+        return term_postings(db, node, batch_size, compact)
+    operands = [postings(db, operand, batch_size, compact)
+                for operand in node.operands]
+    if node.operator == '+':
+        return OrPostings(operands)
+    if node.operator == '*':
+        return AndPostings(operands)
+    return NotPostings(operands[0], operands[1])
+
+
+def query_ids(db, query, batch_size=POSTINGS_BATCH, compact=False):
+    """Generate the cds_id of the documents found by a boolean query,
+    in increasing order."""
+    return iter(postings(db, parse_query(query), batch_size, compact))
+
+
+def boolean_search(db, query, page_size=DEFAULT_PAGE_SIZE, compact=False):
+    """Generate the documents found by a boolean query."""
+    return fetch_documents(db, query_ids(db, query, compact=compact),
+                           page_size)
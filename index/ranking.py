@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+Relevance ranking of the prefix searches.
+
+Documents are scored with BM25, from the number of times each key is
+extracted from a field (tf), the length of the field and the number
+of keys of each text, kept in the terms collection. A key matching
+the searched prefix in several texts or fields adds to the score of
+its document.
+
+The keys of each text are read in cds_id order and merged, so the
+score of a document is complete once the merge moves past it and
+only the best documents are kept in a heap. Prefixes matching more
+than MERGE_LIMIT texts are read with a single range query, also in
+cds_id order, so memory stays bounded by the number of documents kept.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import heapq
+from math import log
+from itertools import groupby
+from operator import itemgetter
+
+from index.search import iter_terms, prefix_query, fetch_documents, \
+     normalize_term, DEFAULT_PAGE_SIZE
+from index.terms import read_field_lengths
+
+K1 = 1.2
+B = 0.75
+DEFAULT_TOP = 20
+# Texts of a prefix read as separate streams merged in cds_id
+# order; more texts are read with a single range query
+MERGE_LIMIT = 50
+
+POSTING_FIELDS = {'_id': False, 'cds_id': True, 'field': True, 'text': True,
+                  'tf': True, 'length': True}
+
+
+def idf(documents, postings):
+    """Inverse document frequency of a text found in postings
+    of the documents."""
+    postings = min(postings, documents)
+    return log(1.0 + (documents - postings + 0.5) / (postings + 0.5))
+
+
+def iter_postings(cursor):
+    """Generate the tuples (cds_id, field, text, tf, length) of the keys
+    read by cursor."""
+    for key in cursor:
+        yield (key['cds_id'], key['field'], key['text'],
+               key.get('tf', 1), key.get('length', 1))
+
+
+def push(heap, size, item):
+    """Keep in the heap the size largest items."""
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def rank(db, term, field=None, top=DEFAULT_TOP, k1=K1, b=B):
+    """Return the list of pairs (score, cds_id) of the top documents
+    with keys starting with term, by decreasing score."""
+    prefix = normalize_term(term)
+    texts = dict(iter_terms(db, prefix, field, prefix=True, page_size=1000))
+    if not texts:
+        return []
+    documents = max(db.cds.estimated_document_count(), 1)
+    weights = dict((text, idf(documents, count))
+                   for text, count in texts.iteritems())
+    averages = read_field_lengths(db.terms)
+
+    def score(postings):
+        total = 0.0
+        for cds_id, key_field, text, tf, length in postings:
+            average = averages.get(key_field) or length
+            norm = k1 * (1.0 - b + b * length / average)
+            total += weights[text] * tf * (k1 + 1.0) / (tf + norm)
+        return total
+
+    if len(texts) <= MERGE_LIMIT:
+        cursors = []
+        for text in sorted(texts):
+            query = {'text': text}
+            if field is not None:
+                query['field'] = field
+            cursor = db.index.find(query, POSTING_FIELDS).sort('cds_id')
+            cursors.append(iter_postings(cursor))
+        postings = heapq.merge(*cursors)
+    else:
+        cursor = db.index.find(prefix_query(prefix, field), POSTING_FIELDS)
+        postings = iter_postings(cursor.sort('cds_id'))
+    heap = []
+    for cds_id, group in groupby(postings, itemgetter(0)):
+        push(heap, top, (score(group), cds_id))
+    heap.sort(reverse=True)
+    return heap
+
+
+def ranked_search(db, term, field=None, top=DEFAULT_TOP,
+                  page_size=DEFAULT_PAGE_SIZE):
+    """Return the list of pairs (score, document) of the top documents
+    with keys starting with term, by decreasing score."""
+    ranked = rank(db, term, field, top)
+    documents = dict((document['_id'], document) for document in
+                     fetch_documents(db, [cds_id for score, cds_id in ranked],
+                                     page_size))
+    return [(score, documents[cds_id]) for score, cds_id in ranked
+            if cds_id in documents]
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Prefix search and dictionary browse of the index collection.
+
+Prefix searches are run as range queries on the text of the keys,
+served by the indexes created by ensure_indexes, and the documents
+found are read from the cds collection a page at a time.
+The dictionary of distinct key texts is browsed a page at a time,
+like the dictionary of WinISIS, from the terms collection.
+
+Searches may also read the postings collection, a compact copy of
+the index collection holding the cds_id of each (text, field) in
+chunks of increasing cds_id: {text, field, first, ids}.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import sys
+from itertools import islice
+
+from pymongo import ASCENDING
+
+from pyisis.folding import fold_text
+from index.terms import ensure_terms_index, ALL_FIELDS, TERM_INDEX
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_BROWSE_SIZE = 20
+
+# The keys of each text are read in cds_id order to rank the results
+TEXT_INDEX = [('text', ASCENDING), ('cds_id', ASCENDING)]
+FIELD_TEXT_INDEX = [('field', ASCENDING), ('text', ASCENDING),
+                    ('cds_id', ASCENDING)]
+POSTINGS_INDEX = [('text', ASCENDING), ('field', ASCENDING),
+                  ('first', ASCENDING)]
+
+
+def ensure_indexes(db):
+    """Create the indexes of the index and terms collections used by
+    the searches. Indexes already created are left untouched."""
+    db.index.create_index(TEXT_INDEX, name='text_cds_id')
+    db.index.create_index(FIELD_TEXT_INDEX, name='field_text_cds_id')
+    ensure_terms_index(db.terms)
+
+
+def ensure_postings_index(collection):
+    """Create the unique index (text, field, first) of the postings
+    collection, which serves its searches."""
+    collection.create_index(POSTINGS_INDEX, unique=True,
+                            name='text_field_first')
+
+
+def normalize_term(term, encoding='utf-8'):
+    """Return the term as the keys are written by the indexer:
+    without accents and uppercased."""
+    if type(term) is not unicode:
+        term = term.decode(encoding)
+    return fold_text(term).upper()
+
+
+def prefix_bounds(prefix):
+    """Return the range query of the strings starting with prefix.
+    Strings are compared by code point, so the upper bound is the
+    prefix with its last character incremented."""
+    prefix = unicode(prefix)
+    upper = prefix
+    while upper and ord(upper[-1]) == sys.maxunicode:
+        upper = upper[:-1]
+    if not upper:
+        return {'$gte': prefix}
+    return {'$gte': prefix, '$lt': upper[:-1] + unichr(ord(upper[-1]) + 1)}
+
+
+def prefix_query(prefix, field=None):
+    """Query of the keys whose text starts with prefix,
+    optionally restricted to one field."""
+    query = {'text': prefix_bounds(prefix)}
+    if field is not None:
+        query['field'] = field
+    return query
+
+
+def search_ids(db, prefix, field=None, skip=0, limit=0):
+    """Generate the cds_id of each key starting with prefix,
+    in the order of the keys, skipping the first skip keys and
+    stopping after limit keys (0 for all of them)."""
+    cursor = db.index.find(prefix_query(prefix, field), {'cds_id': True})
+    for key in cursor.skip(skip).limit(limit):
+        yield key['cds_id']
+
+
+def search_postings_ids(db, prefix, field=None, skip=0, limit=0):
+    """Same as search_ids, reading the postings collection, which gives
+    the cds_id in (text, field, cds_id) order."""
+    cursor = db.postings.find(prefix_query(prefix, field),
+                              {'_id': False, 'ids': True})
+    ids = (id for chunk in cursor.sort(POSTINGS_INDEX) for id in chunk['ids'])
+    return islice(ids, skip, limit and skip + limit or None)
+
+
+def fetch_documents(db, ids, page_size=DEFAULT_PAGE_SIZE):
+    """Generate the documents of the cds collection with the given ids,
+    in the same order and repeated as in ids. Documents are read with a
+    single query per page of page_size ids."""
+    page = []
+    for id in ids:
+        page.append(id)
+        if len(page) >= page_size:
+            for document in _fetch_page(db, page):
+                yield document
+            page = []
+    for document in _fetch_page(db, page):
+        yield document
+
+
+def _fetch_page(db, ids):
+    if not ids:
+        return
+    documents = dict((document['_id'], document) for document in
+                     db.cds.find({'_id': {'$in': list(set(ids))}}))
+    for id in ids:
+        if id in documents:
+            yield documents[id]
+
+
+def search(db, term, field=None, page_size=DEFAULT_PAGE_SIZE,
+           skip=0, limit=0, compact=False):
+    """Generate the documents having a key that starts with term,
+    once for each matching key. skip and limit select a range of
+    the matching keys, as in search_ids. If compact is True the keys
+    are read from the postings collection."""
+    prefix = normalize_term(term)
+    if compact:
+        ids = search_postings_ids(db, prefix, field, skip, limit)
+    else:
+        ids = search_ids(db, prefix, field, skip, limit)
+    return fetch_documents(db, ids, page_size)
+
+
+def browse_terms(db, start=u'', limit=DEFAULT_BROWSE_SIZE, field=None,
+                 after=None, prefix=False):
+    """Return the next limit distinct key texts at or after start, in
+    sorted order, as the tuple (terms, after) where terms is the list
+    of pairs (text, number of keys). The next page is read passing the
+    returned after, which is None once the dictionary is exhausted.
+
+    If prefix is True only texts starting with start are returned.
+    """
+    start = normalize_term(start)
+    if after is None and not start:
+        # the blank text is never listed, even by terms
+        # collections that still count it
+        after = start
+    if prefix:
+        bounds = prefix_bounds(start)
+    else:
+        bounds = {'$gte': start}
+    if after is not None:
+        bounds.pop('$gte', None)
+        bounds['$gt'] = after
+    if field is None:
+        field = ALL_FIELDS
+    # one more term tells whether there is a next page
+    cursor = db.terms.find({'field': field, 'text': bounds},
+                           {'_id': False, 'text': True, 'count': True})
+    terms = [(term['text'], term['count'])
+             for term in cursor.sort(TERM_INDEX).limit(limit + 1)]
+    if len(terms) > limit:
+        del terms[limit:]
+        return terms, terms[-1][0]
+    return terms, None
+
+
+def iter_terms(db, start=u'', field=None, prefix=False,
+               page_size=DEFAULT_BROWSE_SIZE):
+    """Generate the pairs (text, number of keys) of every distinct
+    key text at or after start, reading them a page at a time."""
+    after = None
+    while True:
+        terms, after = browse_terms(db, start, page_size, field, after, prefix)
+        for term in terms:
+            yield term
+        if after is None:
+            break
+
+
+def npost(db, term, field=None):
+    """Return the number of keys (postings) with the given text."""
+    if field is None:
+        field = ALL_FIELDS
+    found = db.terms.find_one({'field': field, 'text': normalize_term(term)},
+                              {'count': True})
+    if found is None:
+        return 0
+    return found['count']
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+HTTP search service over the index, cds and terms collections.
+
+A long lived server answering JSON requests, sharing a single
+MongoClient (and its connection pool) between the threads that serve
+the requests:
+
+    GET /search?q=TERM[&field=TAG][&offset=N][&limit=N][&rank=1]
+    GET /suggest?q=TERM[&field=TAG][&after=TEXT][&limit=N]
+    GET /npost?q=TERM[&field=TAG]
+    GET /query?q=QUERY[&offset=N][&limit=N]
+
+where QUERY is a boolean query in the syntax of CDS/ISIS.
+
+The service works with any object giving the collections as
+attributes (a pymongo Database or a mock of it). Searches may be
+answered from a SearchCache.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import sys
+import json
+import threading
+from time import time
+from itertools import islice
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from index.search import search, browse_terms, npost, ensure_indexes, \
+     fetch_documents, DEFAULT_PAGE_SIZE, DEFAULT_BROWSE_SIZE
+from index.ranking import ranked_search
+from index.query import query_ids, QueryError
+
+DEFAULT_LIMIT = 20
+# Largest number of documents or terms of a response
+MAX_LIMIT = 1000
+# Requests served at the same time, the others wait for
+# at most QUEUE_TIMEOUT seconds before being refused
+MAX_REQUESTS = 32
+QUEUE_TIMEOUT = 5.0
+
+
+class BadRequest(Exception):
+    """Invalid parameters of a request."""
+
+
+class SearchService(object):
+    """Answers the requests of the search service, returning
+    the objects sent back as JSON."""
+    def __init__(self, db, page_size=DEFAULT_PAGE_SIZE, cache=None):
+        self.db = db
+        self.page_size = page_size
+        self.cache = cache
+
+    def _term(self, params):
+        try:
+            return params['q'][0]
+        except KeyError:
+            raise BadRequest('missing parameter q')
+
+    def _int(self, params, name, default, maximum=None):
+        try:
+            value = int(params.get(name, [default])[0])
+        except ValueError:
+            raise BadRequest('parameter %s must be a number' % name)
+        if value < 0 or (maximum is not None and value > maximum):
+            raise BadRequest('parameter %s out of range' % name)
+        return value
+
+    def search(self, params):
+        """Documents with keys starting with q, or the limit most
+        relevant ones, with their scores, if rank is 1."""
+        term = self._term(params)
+        field = params.get('field', [None])[0]
+        offset = self._int(params, 'offset', 0)
+        limit = self._int(params, 'limit', DEFAULT_LIMIT, MAX_LIMIT) or \
+                DEFAULT_LIMIT
+        if self._int(params, 'rank', 0, 1):
+            ranked = ranked_search(self.db, term, field, limit, self.page_size)
+            return {'q': term, 'field': field,
+                    'documents': [document for score, document in ranked],
+                    'scores': [score for score, document in ranked]}
+        if self.cache is not None:
+            documents = self.cache.search(term, field, offset, limit)
+        else:
+            documents = list(search(self.db, term, field,
+                                    min(self.page_size, limit), offset, limit))
+        result = {'q': term, 'field': field, 'offset': offset,
+                  'documents': documents, 'next': None}
+        if len(documents) == limit:
+            result['next'] = offset + limit
+        return result
+
+    def suggest(self, params):
+        """Page of the dictionary of the keys starting with q."""
+        term = self._term(params)
+        field = params.get('field', [None])[0]
+        after = params.get('after', [None])[0]
+        if after is not None:
+            after = after.decode('utf-8')
+        limit = self._int(params, 'limit', DEFAULT_BROWSE_SIZE, MAX_LIMIT) or \
+                DEFAULT_BROWSE_SIZE
+        terms, after = browse_terms(self.db, term, limit, field, after,
+                                    prefix=True)
+        return {'q': term, 'field': field, 'next': after,
+                'terms': [{'text': text, 'count': count}
+                          for text, count in terms]}
+
+    def npost(self, params):
+        """Number of keys equal to q."""
+        term = self._term(params)
+        field = params.get('field', [None])[0]
+        return {'q': term, 'field': field,
+                'count': npost(self.db, term, field)}
+
+    def query(self, params):
+        """Documents found by the boolean query q."""
+        term = self._term(params)
+        offset = self._int(params, 'offset', 0)
+        limit = self._int(params, 'limit', DEFAULT_LIMIT, MAX_LIMIT) or \
+                DEFAULT_LIMIT
+        try:
+            ids = list(islice(query_ids(self.db, term), offset, offset + limit))
+        except QueryError, ex:
+            raise BadRequest('invalid query: %s' % ex)
+        documents = list(fetch_documents(self.db, ids, self.page_size))
+        result = {'q': term, 'offset': offset, 'documents': documents,
+                  'next': None}
+        if len(ids) == limit:
+            result['next'] = offset + limit
+        return result
+
+    routes = {'/search': search, '/suggest': suggest, '/npost': npost,
+              '/query': query}
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            route = SearchService.routes[url.path]
+        except KeyError:
+            self.send_json(404, {'error': 'unknown path %s' % url.path})
+            return
+        if not self.server.slots.acquire(QUEUE_TIMEOUT):
+            self.send_json(503, {'error': 'too many requests'})
+            return
+        try:
+            try:
+                result = route(self.server.service, parse_qs(url.query))
+            except BadRequest, ex:
+                self.send_json(400, {'error': str(ex)})
+                return
+            except Exception, ex:
+                self.log_error('%s: %s', url.path, ex)
+                self.send_json(500, {'error': str(ex)})
+                return
+        finally:
+            self.server.slots.release()
+        self.send_json(200, result)
+
+    def send_json(self, code, result):
+        body = json.dumps(result, default=unicode)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class TimeoutSemaphore(object):
+    """Bounded semaphore whose acquire accepts a timeout."""
+    def __init__(self, value):
+        self.value = value
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout):
+        deadline = time() + timeout
+        self.condition.acquire()
+        try:
+            while self.value <= 0:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.value -= 1
+            return True
+        finally:
+            self.condition.release()
+
+    def release(self):
+        self.condition.acquire()
+        try:
+            self.value += 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+
+class SearchServer(ThreadingMixIn, HTTPServer):
+    """HTTP server answering each request in its own thread,
+    serving at most max_requests of them at the same time."""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, service, max_requests=MAX_REQUESTS,
+                 quiet=False):
+        HTTPServer.__init__(self, address, SearchRequestHandler)
+        self.service = service
+        self.slots = TimeoutSemaphore(max_requests)
+        self.quiet = quiet
+
+
+def serve(db, host='', port=8080, max_requests=MAX_REQUESTS, quiet=False,
+          page_size=DEFAULT_PAGE_SIZE, cache=None):
+    """Create the indexes used by the searches and serve
+    the requests until interrupted."""
+    ensure_indexes(db)
+    server = SearchServer((host, port), SearchService(db, page_size, cache),
+                          max_requests, quiet)
+    sys.stderr.write('serving on %s:%d\n' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
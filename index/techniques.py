@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Indexing techniques applied to the documents of the cds collection.
+Each technique receives the text of a subfield and returns the list
+of keys extracted from it. KeyExtractor produces the keys of all of
+them at once.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import re
+from string import maketrans
+
+import pyisis.folding
+from pyisis.folding import fold_text, fold_many
+
+#Quantidade de caracteres indexados pela tecnica 0
+LIMIT = 30
+
+# Document keys that are not fields
+NON_FIELD_KEYS = ('mfn', '_id', 'active')
+
+tec_0_pat = re.compile("[\<\>\:\(\)\"\'\,]")
+tec_2_pat = re.compile("[\:\(\)\"\'\,]")
+tec_2_key_pat = re.compile('\<[A-Z\ 0-9\.]{1,100}\>')
+tec_2_strip_pat = re.compile("[\<\>]")
+tec_4_split_pat = re.compile('[ \.\n\,\<\>]')
+
+# Characters replaced by spaces (techniques 0 and 2)
+# or split at (technique 4) before the text is folded
+TEC_0_CHARS = u'<>:()"\','
+TEC_2_CHARS = u':()"\','
+TEC_4_CHARS = u' .\n,<>'
+SPECIAL_CHARS = frozenset(TEC_0_CHARS + TEC_4_CHARS)
+tec_0_trans = maketrans(str(TEC_0_CHARS), ' ' * len(TEC_0_CHARS))
+tec_2_trans = maketrans(str(TEC_2_CHARS), ' ' * len(TEC_2_CHARS))
+
+# Non ASCII characters that fold into special characters are kept
+# as private use characters until the techniques are applied
+PLACEHOLDER_BASE = 0xE000
+placeholder_pat = re.compile(u'[\ue000-\uf8ff]')
+
+
+def remover_acentos(txt, codif='utf-8'):
+    return fold_text(txt.decode(codif))
+
+def index_tec_0(text):
+    """Whole text, up to LIMIT characters."""
+    text = tec_0_pat.sub(" ", text)
+    text = fold_text(text).replace("  "," ").upper()
+    return [text[:LIMIT].strip()]
+
+def index_tec_2(text):
+    """Terms between angle brackets."""
+    text = tec_2_pat.sub(" ", text)
+    text = fold_text(text).replace("  "," ").upper()
+    return [tec_2_strip_pat.sub(" ", t).strip()
+            for t in tec_2_key_pat.findall(text.strip())]
+
+def index_tec_4(text):
+    """Every word."""
+    return [t.replace("  "," ").upper().strip()
+            for t in fold_many(tec_4_split_pat.split(text))]
+
+TECHNIQUES = (index_tec_0, index_tec_2, index_tec_4)
+
+
+class NormalizationTable(dict):
+    """Translate table of a KeyExtractor, extended on demand."""
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    def __missing__(self, codepoint):
+        value = self[codepoint] = self.extractor.normalize_char(codepoint)
+        return value
+
+
+class KeyExtractor(object):
+    """Extracts the keys of techniques 0, 2 and 4 of a text, giving
+    the same keys as index_tec_0, index_tec_2 and index_tec_4.
+
+    The text is folded and uppercased once, and each technique takes
+    its keys from the result with a str.translate call or a split.
+    The few non ASCII characters that fold into special characters
+    (the ones techniques replace or split at, like no-break space or
+    spacing accents) are held as placeholders, folded only when the
+    techniques are applied, since the original techniques replace or
+    split before folding.
+    """
+    def __init__(self, limit=LIMIT):
+        self.limit = limit
+        self.placeholders = 0
+        self.table = NormalizationTable(self)
+        self.resolve_table = {}
+        self.tec_0_table = dict((ord(char), u' ') for char in TEC_0_CHARS)
+        self.tec_2_table = dict((ord(char), u' ') for char in TEC_2_CHARS)
+
+    def normalize_char(self, codepoint):
+        """Return the folded character or its placeholder."""
+        folded = pyisis.folding.table[codepoint]
+        if codepoint < 128 or not SPECIAL_CHARS.intersection(folded):
+            return folded
+        placeholder = PLACEHOLDER_BASE + self.placeholders
+        self.placeholders += 1
+        for table in (self.resolve_table, self.tec_0_table, self.tec_2_table):
+            table[placeholder] = folded
+        return unichr(placeholder)
+
+    def extract(self, text):
+        """Return the lists of keys of techniques 0, 2 and 4 of text."""
+        if type(text) is not unicode:
+            text = unicode(text)
+        if pyisis.folding.surrogate_pat is not None and \
+           pyisis.folding.surrogate_pat.search(text):
+            return index_tec_0(text), index_tec_2(text), index_tec_4(text)
+
+        normalized = text.translate(self.table)
+        if self.placeholders and placeholder_pat.search(normalized):
+            return self.extract_placeholders(normalized)
+        folded = normalized.encode('ascii').upper()
+
+        tec_0 = folded.translate(tec_0_trans).replace("  "," ")
+        keys_0 = [tec_0[:self.limit].strip()]
+
+        tec_2 = folded.translate(tec_2_trans).replace("  "," ")
+        keys_2 = [tec_2_strip_pat.sub(" ", t).strip()
+                  for t in tec_2_key_pat.findall(tec_2.strip())]
+
+        # tokens have no spaces left to be replaced
+        keys_4 = [token.strip() for token in tec_4_split_pat.split(folded)]
+
+        return keys_0, keys_2, keys_4
+
+    def extract_placeholders(self, normalized):
+        """Same as extract, for a normalized text holding placeholders."""
+        tec_0 = normalized.translate(self.tec_0_table).encode('ascii')
+        tec_0 = tec_0.replace("  "," ").upper()
+        keys_0 = [tec_0[:self.limit].strip()]
+
+        tec_2 = normalized.translate(self.tec_2_table).encode('ascii')
+        tec_2 = tec_2.replace("  "," ").upper()
+        keys_2 = [tec_2_strip_pat.sub(" ", t).strip()
+                  for t in tec_2_key_pat.findall(tec_2.strip())]
+
+        keys_4 = [token.translate(self.resolve_table).encode('ascii')
+                  .replace("  "," ").upper().strip()
+                  for token in tec_4_split_pat.split(normalized)]
+
+        return keys_0, keys_2, keys_4
+
+extractor = KeyExtractor()
+
+
+def iter_field_texts(document):
+    """Generate the pairs (field, text) of the subfields to be
+    indexed in a document exported by pyisis2json.py.
+    """
+    for field in document.keys():
+        if field in NON_FIELD_KEYS:
+            continue
+        for occurrence in document[field]:
+            for k in occurrence:
+                if type(occurrence[k]) is list:
+                    yield field, occurrence[k][0]
+
+def extract_keys(document):
+    """Generate the index keys (cds_id, field, text) of a document."""
+    id = document['_id']
+    for field, text in iter_field_texts(document):
+        for keys in extractor.extract(text):
+            for key in keys:
+                yield (id, field, key)
+
+def document_keys(document):
+    """Return the distinct index keys of a document, in the order of
+    extract_keys, as tuples (cds_id, field, text, tf, length) where tf
+    is the number of times the key is extracted from the field and
+    length the number of keys extracted from the field."""
+    tfs = {}
+    lengths = {}
+    order = []
+    for key in extract_keys(document):
+        if key in tfs:
+            tfs[key] += 1
+        else:
+            tfs[key] = 1
+            order.append(key)
+        field = key[:2]
+        lengths[field] = lengths.get(field, 0) + 1
+    return [key + (tfs[key], lengths[key[:2]]) for key in order]
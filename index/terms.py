@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dictionary of the index collection, kept in the terms collection.
+
+Each document of the terms collection holds a key text of a field
+with its number of keys (postings) and the cds_id of the first ones:
+
+    {'field': '69', 'text': 'MEASUREMENT', 'count': 12, 'ids': [...]}
+
+Documents with field ALL_FIELDS count the keys of every field.
+Documents with field FIELD_LENGTHS hold, for the field tag in text,
+the number of documents with the field and the sum of their lengths
+(number of keys extracted from the field), used to rank the results.
+The counts are updated incrementally as keys are written to or
+removed from the index collection, so browsing the dictionary or
+counting postings takes a single indexed read.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+from pymongo import ASCENDING, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+
+# Field of the terms counting the keys of every field
+ALL_FIELDS = ''
+# Field of the documents holding the lengths of each field
+FIELD_LENGTHS = '#length'
+# cds_id kept in each term
+TERM_IDS = 10
+# MongoDB error code of a duplicate key in a unique index
+DUPLICATE_KEY = 11000
+
+TERM_INDEX = [('field', ASCENDING), ('text', ASCENDING)]
+
+
+def ensure_terms_index(collection):
+    """Create the unique index (field, text) of the terms collection,
+    which also serves the dictionary browse."""
+    collection.create_index(TERM_INDEX, unique=True, name='field_text')
+
+
+def group_keys(keys):
+    """Return a dict mapping (field, text) to the pair (number of keys,
+    sorted list of distinct cds_id) of the keys (cds_id, field, text,
+    tf, length), including the terms (ALL_FIELDS, text). Keys with
+    an empty text, left by technique 4, are not terms."""
+    groups = {}
+    for key in keys:
+        id, field, text = key[:3]
+        if not text:
+            continue
+        for term in ((field, text), (ALL_FIELDS, text)):
+            try:
+                group = groups[term]
+            except KeyError:
+                group = groups[term] = [0, set()]
+            group[0] += 1
+            group[1].add(id)
+    return dict((term, (count, sorted(ids)))
+                for term, (count, ids) in groups.iteritems())
+
+
+def _write(collection, requests):
+    """Write the requests unordered, retrying once the upserts that
+    failed because another process inserted the same term."""
+    if not requests:
+        return
+    try:
+        collection.bulk_write(requests, ordered=False)
+    except BulkWriteError, ex:
+        errors = ex.details['writeErrors']
+        if [error for error in errors if error['code'] != DUPLICATE_KEY]:
+            raise
+        collection.bulk_write([requests[error['index']] for error in errors],
+                              ordered=False)
+
+
+def field_lengths(fields, sign=1):
+    """Return the requests adding (or with sign=-1 subtracting) the
+    fields (cds_id, field, length) to the lengths of each field."""
+    totals = {}
+    for id, field, length in fields:
+        total = totals.setdefault(field, [0, 0])
+        total[0] += 1
+        total[1] += length
+    return [UpdateOne({'field': FIELD_LENGTHS, 'text': field},
+                      {'$inc': {'count': sign * count,
+                                'length': sign * length}},
+                      upsert=sign > 0)
+            for field, (count, length) in totals.iteritems()]
+
+
+def read_field_lengths(collection):
+    """Return a dict mapping each field tag to the average length
+    of the field."""
+    return dict((found['text'], float(found['length']) / found['count'])
+                for found in collection.find({'field': FIELD_LENGTHS})
+                if found['count'] > 0)
+
+
+def add_terms(collection, keys, fields=()):
+    """Count the keys (cds_id, field, text, tf, length) just written
+    to the index collection, and the fields (cds_id, field, length)
+    indexed for the first time."""
+    requests = field_lengths(fields)
+    for (field, text), (count, ids) in group_keys(keys).iteritems():
+        requests.append(UpdateOne(
+            {'field': field, 'text': text},
+            {'$inc': {'count': count},
+             '$push': {'ids': {'$each': ids[:TERM_IDS], '$slice': TERM_IDS}}},
+            upsert=True))
+    _write(collection, requests)
+
+
+def remove_terms(collection, keys, fields=()):
+    """Discount the keys (cds_id, field, text, tf, length) and the
+    fields (cds_id, field, length) just removed from the index
+    collection, deleting the terms left without keys."""
+    groups = group_keys(keys)
+    requests = field_lengths(fields, -1)
+    for (field, text), (count, ids) in groups.iteritems():
+        requests.append(UpdateOne(
+            {'field': field, 'text': text},
+            {'$inc': {'count': -count}, '$pullAll': {'ids': ids}}))
+    _write(collection, requests)
+    emptied = set(groups)
+    emptied.update((FIELD_LENGTHS, field) for id, field, length in fields)
+    _write(collection, [DeleteOne({'field': field, 'text': text,
+                                   'count': {'$lte': 0}})
+                        for field, text in emptied])
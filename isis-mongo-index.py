@@ -1,52 +1,98 @@
 #!/usr/bin/env python
-import pymongo, re
-#from tio import tioclient
-from unicodedata import normalize
-
-def remover_acentos(txt, codif='utf-8'): 
-    unicode('\xe1', errors='ignore')
-    return normalize('NFKD', txt.decode(codif)).encode('ASCII','ignore') 
-
-def index_tec_0(id, field, text):
-    #Quantidade de caracteres indexados pela tecnica 0
-    LIMIT = 30
-    text = re.sub("[\<\>\:\(\)\"\'\,]"," ",text)
-    text = remover_acentos(text.encode("utf-8")).replace("  "," ").upper()
-    save({'cds_id':id,'field':field,'text':text[:LIMIT].strip()})
-
-def index_tec_2(id, field, text):
-    text = re.sub("[\:\(\)\"\'\,]"," ",text)
-    text = remover_acentos(text.encode("utf-8")).replace("  "," ").upper()
-    for t in re.findall('\<[A-Z\ 0-9\.]{1,100}\>',text.strip()):
-        t = re.sub("[\<\>]"," ",t)
-        save({'cds_id':id,'field':field,'text':t.strip()})
-            
-def index_tec_4(id, field, text):
-    for t in re.split('[ \.\n\,\<\>]',text):
-        t = remover_acentos(t.encode("utf-8")).replace("  "," ").upper()
-        save({'cds_id':id,'field':field,'text':t.strip()})
-        
-def save(tj):
-    try:
-        db.index.find(tj).next()
-    except:
-        db.index.save(tj)
-
-mongo = pymongo.Connection("localhost", 27017)
-db = mongo.bireme
-
-
-for document in db.cds.find({}):
-    id = document['_id']
-    for field in document.keys():
-        if not field == "mfn" and not field == "_id" and not field == "active":
-            for i in range(len(document[field])):
-                for k in document[field][i]:
-                    if type(document[field][i][k]) is list:
-                        index_tec_0(id, field, document[field][i][k][0])
-                        index_tec_2(id, field, document[field][i][k][0])
-                        index_tec_4(id, field, document[field][i][k][0])
-                        
+import sys, argparse
+
+import pymongo
+
+from index.bulk import index_collection, index_file, index_parallel, \
+     count_terms, DEFAULT_BATCH_SIZE
+from index.search import ensure_indexes
+from index.cache import bump_generation
+
+"""
+
+Index the documents of the cds collection, imported from the output
+of pyisis2json.py, into the index collection with techniques 0, 2 and 4.
+The keys may also be read from the file written by pyisis2json.py
+--index-out, which avoids reading the cds collection back.
+The keys written are counted in the terms collection, the dictionary
+used by test_search_suggest.py. Once done, a new generation of the
+index is started, so search services drop their cached results.
+
+"""
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 27017
+DEFAULT_DB = 'bireme'
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Index the cds collection into the index collection')
+
+    # add the arguments
+    parser.add_argument(
+        '--host', default=DEFAULT_HOST,
+        help='MongoDB host (default=%s)' % DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help='MongoDB port (default=%d)' % DEFAULT_PORT)
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help='database name (default=%s)' % DEFAULT_DB)
+    parser.add_argument(
+        '-b', '--batch', type=int, default=DEFAULT_BATCH_SIZE,
+        help='keys written per request (default=%d)' % DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        '--drop', const=True, action='store_const',
+        help='drop the index collection and rebuild it from scratch')
+    parser.add_argument(
+        '-f', '--file', type=argparse.FileType('r'), metavar='INDEX.json',
+        help='read the keys from the file written by pyisis2json.py '
+             '--index-out instead of the cds collection')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1,
+        help='processes indexing the cds collection, each one a range '
+             'of _id values (default=1)')
+    parser.add_argument(
+        '--no-terms', const=True, action='store_const',
+        help='do not count the keys in the terms collection')
+    parser.add_argument(
+        '--count-terms', const=True, action='store_const',
+        help='only rebuild the terms collection from the index collection')
+
+    # parse the command line
+    args = parser.parse_args()
+    if args.file and args.workers > 1:
+        parser.error('--workers can not be used with --file')
+    mongo = pymongo.MongoClient(args.host, args.port)
+    db = mongo[args.db]
+    terms = terms_name = None
+    if not args.no_terms:
+        terms = db.terms
+        terms_name = terms.name
+    if args.count_terms:
+        count = count_terms(db.index, db.terms, args.batch)
+        sys.stderr.write('%d keys counted\n' % count)
+    else:
+        if args.drop:
+            db.index.drop()
+            db.terms.drop()
+        if args.file:
+            index_file(args.file, db.index, args.batch, fresh=bool(args.drop),
+                       output=sys.stderr, terms=terms)
+        elif args.workers > 1:
+            index_parallel(args.host, args.port, args.db, args.workers,
+                           args.batch, fresh=bool(args.drop), output=sys.stderr,
+                           terms=terms_name)
+        else:
+            index_collection(db.cds, db.index, args.batch,
+                             fresh=bool(args.drop), output=sys.stderr,
+                             terms=terms)
+    # indexes of the prefix searches, built once the keys are written
+    ensure_indexes(db)
+    # results cached by the search services are no longer valid
+    bump_generation(db)
 
 #http://www.mongodb.org/display/DOCS/Advanced+Queries
 #for document in idx.cds.find({}):
@@ -54,4 +100,3 @@ for document in db.cds.find({}):
 #for i in dm.index.find({'text':{'$regex':'^STOCKHOLM INTERNA'}},{"cds_id":True}):
 #    for d in db.cds.find({"_id":i['cds_id']}):
 #        print d
-
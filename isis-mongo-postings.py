@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import sys, argparse
+
+import pymongo
+
+from index.postings import build_postings, compare, CHUNK_SIZE
+
+"""
+
+Build the postings collection, the compact form of the index
+collection with the cds_id of each key text and field in chunks,
+and compare the storage and search times of both collections.
+
+"""
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 27017
+DEFAULT_DB = 'bireme'
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Build the postings collection from the index collection')
+
+    # add the arguments
+    parser.add_argument(
+        '--host', default=DEFAULT_HOST,
+        help='MongoDB host (default=%s)' % DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help='MongoDB port (default=%d)' % DEFAULT_PORT)
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help='database name (default=%s)' % DEFAULT_DB)
+    parser.add_argument(
+        '-c', '--chunk', type=int, default=CHUNK_SIZE,
+        help='cds_id per postings document (default=%d)' % CHUNK_SIZE)
+    parser.add_argument(
+        '-r', '--report', const=True, action='store_const',
+        help='only compare the index and postings collections')
+    parser.add_argument(
+        '-n', '--terms', type=int, default=20,
+        help='most frequent texts searched by the report (default=20)')
+
+    # parse the command line
+    args = parser.parse_args()
+    db = pymongo.MongoClient(args.host, args.port)[args.db]
+    if not args.report:
+        build_postings(db.index, db.postings, args.chunk, sys.stderr)
+    compare(db, args.terms)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import argparse
+
+import pymongo
+
+from index.service import serve, MAX_REQUESTS
+from index.search import DEFAULT_PAGE_SIZE
+from index.cache import SearchCache, DEFAULT_CACHE_SIZE, DEFAULT_TTL
+
+"""
+
+Serve the searches of the index collection over HTTP, answering with
+JSON. The server is long lived and shares one pooled connection to
+MongoDB between its threads; see index/service.py for the requests.
+
+"""
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 27017
+DEFAULT_DB = 'bireme'
+DEFAULT_HTTP_PORT = 8080
+# Milliseconds waited for MongoDB before a request fails
+DEFAULT_TIMEOUT = 5000
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Serve the searches of the index collection over HTTP')
+
+    # add the arguments
+    parser.add_argument(
+        '--host', default=DEFAULT_HOST,
+        help='MongoDB host (default=%s)' % DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help='MongoDB port (default=%d)' % DEFAULT_PORT)
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help='database name (default=%s)' % DEFAULT_DB)
+    parser.add_argument(
+        '-l', '--listen', default='',
+        help='address the service listens on (default=all)')
+    parser.add_argument(
+        '-P', '--http-port', type=int, default=DEFAULT_HTTP_PORT,
+        help='port the service listens on (default=%d)' % DEFAULT_HTTP_PORT)
+    parser.add_argument(
+        '-r', '--requests', type=int, default=MAX_REQUESTS,
+        help='requests served at the same time, which is also the size '
+             'of the connection pool (default=%d)' % MAX_REQUESTS)
+    parser.add_argument(
+        '-p', '--page', type=int, default=DEFAULT_PAGE_SIZE,
+        help='documents read per query (default=%d)' % DEFAULT_PAGE_SIZE)
+    parser.add_argument(
+        '-t', '--timeout', type=int, default=DEFAULT_TIMEOUT,
+        help='milliseconds waited for MongoDB (default=%d)' % DEFAULT_TIMEOUT)
+    parser.add_argument(
+        '-c', '--cache', type=int, default=DEFAULT_CACHE_SIZE,
+        help='search results kept in memory, 0 disables the cache '
+             '(default=%d)' % DEFAULT_CACHE_SIZE)
+    parser.add_argument(
+        '--ttl', type=float, default=DEFAULT_TTL,
+        help='seconds a search result is kept (default=%g)' % DEFAULT_TTL)
+    parser.add_argument(
+        '-q', '--quiet', const=True, action='store_const',
+        help='do not log each request')
+
+    # parse the command line
+    args = parser.parse_args()
+    mongo = pymongo.MongoClient(args.host, args.port,
+                                maxPoolSize=args.requests,
+                                socketTimeoutMS=args.timeout,
+                                serverSelectionTimeoutMS=args.timeout)
+    db = mongo[args.db]
+    cache = None
+    if args.cache > 0:
+        cache = SearchCache(db, args.cache, args.ttl, page_size=args.page)
+    serve(db, args.listen, args.http_port, args.requests, bool(args.quiet),
+          args.page, cache)
@@ -4,7 +4,7 @@
 Handling of formatting language. Abstract Syntax Tree.
 """
 
-__updated__ = "2009-07-30"
+__updated__ = "2026-10-18"
 __created__ = "2007-05-20"
 __author__  = "Rodrigo Senra <rsenra@acm.org>"
 
@@ -21,6 +21,7 @@ from copy import copy
 from pyisis.fields import MasterField, MasterContainerField
 import engine
 import pyisis.config
+import pyisis.gizmo
 
 
 # Mode flags and vars
@@ -39,8 +40,10 @@ EMPTYSPACES     = 2
 TWOSPACES       = " " * 2
 SINGLESPACE     = " "
 
-#cache to ref function
+#cache to ref function, keyed as the pools by ref_key()
 _ref_record_cache = {}
+#MasterFiles opened by ref function when no session pool is given
+_ref_mst_pool = {}
 
 class BreakException(Exception):
     def __init__(self, value):
@@ -58,20 +61,30 @@ class ContinueException(Exception):
 def get_last_line(workarea, remove=True):
     """ Given the workarea, return the last line, consisting in
     text starting from the last linefeed to the end of the workarea.
+    The workarea is scanned backwards, so only the pieces of the last
+    line are joined.
     """
     if (not workarea):
         return ''
     
+    linesep = LeafNode.linesep
     try:
-        if workarea[-1][-1] == LeafNode.linesep:
+        if workarea[-1][-1] == linesep:
             return ''
     except:
         pass 
 
-    result = ''.join(workarea)
-    position = result.rfind(LeafNode.linesep) + 1
-    last_line = result[position:]
-    return last_line
+    if len(linesep) != 1:
+        # a multi-char linesep may be split across pieces
+        result = ''.join(workarea)
+        position = result.rfind(linesep) + 1
+        return result[position:]
+
+    for idx in xrange(len(workarea)-1, -1, -1):
+        position = workarea[idx].rfind(linesep)
+        if position >= 0:
+            return ''.join([workarea[idx][position+1:]] + workarea[idx+1:])
+    return ''.join(workarea)
 
 
 def strip_func_params(func_name, param_nodes, expected_param_count):
@@ -643,7 +656,6 @@ class RepeatableGroup(LeafNode):
         return "%s(%r)"%(self.__class__.__name__, self.value)
 
     def eval(self, record, mst, workarea, chain, pos, occ=0, debug=False):
-        results = []
         occs = 0
         lineseppos = 0
 
@@ -676,59 +688,92 @@ class RepeatableGroup(LeafNode):
             limit = occs+2
         else:
             limit = occs+1
-        for occ in range(1, limit):
-      
-            try:
-                # prepare new chain == self.value
-                self.value.mode = chain.mode
-                self.value.case = chain.case
-                self.value.occ = occ
-                # Loop through the new chain
-                # collecting output for each occurence
-                for position, node in enumerate(sequence):
-      
-                    if isinstance(node, RepeatableLiteral):
-                        continue
-                    #Some nodes dont have value attr. ex. Branch
-                    try:
-                        if node.value == '/' and results[-1] == LeafNode.linesep:
+
+        # Occurrences are written straight into the workarea after mark
+        # and moved out of it at the end, so each node sees the output
+        # produced so far without copying it. Only Field nodes keep what
+        # they write; changes made by other nodes are undone.
+        mark = len(workarea)
+        rewrites = self.rewrites_workarea()
+        size, last = mark, None
+        try:
+            for occ in range(1, limit):
+          
+                try:
+                    # prepare new chain == self.value
+                    self.value.mode = chain.mode
+                    self.value.case = chain.case
+                    self.value.occ = occ
+                    self.value.mst_pool = getattr(chain, 'mst_pool', None)
+                    # Loop through the new chain
+                    # collecting output for each occurence
+                    for position, node in enumerate(sequence):
+          
+                        if isinstance(node, RepeatableLiteral):
                             continue
-                    except:
-                        pass
-                    
-                    if isinstance(node,Field):                        
-                        sweepRepeatableLiteral(record, mst, workarea+results, self.value, occ, debug)
-                        temp_result = node.format(record, mst, workarea+results, self.value, pos, occ, debug)                        
-                        if temp_result:
-                            results += temp_result[len(workarea+results):]
-                        continue
+                        #Some nodes dont have value attr. ex. Branch
+                        try:
+                            if node.value == '/' and len(workarea) > mark and \
+                               workarea[-1] == LeafNode.linesep:
+                                continue
+                        except:
+                            pass
+                        
+                        if isinstance(node,Field):                        
+                            field_size = len(workarea)
+                            sweepRepeatableLiteral(record, mst, workarea, self.value, occ, debug)
+                            if not node.format(record, mst, workarea, self.value, pos, occ, debug):
+                                del workarea[field_size:]
+                            continue
+        
+                        size = len(workarea)
+                        last = workarea[-1] if size else None
+                        if rewrites:
+                            evaluated = node.eval(record, mst, workarea[:], self.value,
+                                                  position, occ=occ, debug=debug)
+                        else:
+                            evaluated = node.eval(record, mst, workarea, self.value,
+                                                  position, occ=occ, debug=debug)
+                            restore_workarea(workarea, size, last)
     
-                    else:
-                        evaluated = node.eval(record, mst, workarea + results, self.value,
-                                              position, occ=occ, debug=debug)
-
-                    if evaluated:
-                        results.append(''.join(evaluated))
-
-            except ContinueException, lastvalue:
-                if lastvalue.value:
-                    results.append(str(lastvalue.value))
-                if lineseppos > position:
-                    # don't put "." to last empty index/InconditinalLiteral
-                    if chain.mode == 'D' and occ <= occs:
-                        if results[-1].strip()[-1] != '.':
-                            results.append('.  ')
-                    results.append(LeafNode.linesep)
-                continue
-            
-            except BreakException, lastvalue:
-                if lastvalue.value:
-                    results.append(str(lastvalue.value))
-                if lineseppos > position:
-                    results.append(LeafNode.linesep)
-                break
-            
-        return ''.join(results)
+                        if evaluated:
+                            workarea.append(''.join(evaluated))
+    
+                except ContinueException, lastvalue:
+                    restore_workarea(workarea, size, last)
+                    if lastvalue.value:
+                        workarea.append(str(lastvalue.value))
+                    if lineseppos > position:
+                        # don't put "." to last empty index/InconditinalLiteral
+                        if chain.mode == 'D' and occ <= occs and len(workarea) > mark:
+                            if workarea[-1].strip()[-1] != '.':
+                                workarea.append('.  ')
+                        workarea.append(LeafNode.linesep)
+                    continue
+                
+                except BreakException, lastvalue:
+                    restore_workarea(workarea, size, last)
+                    if lastvalue.value:
+                        workarea.append(str(lastvalue.value))
+                    if lineseppos > position:
+                        workarea.append(LeafNode.linesep)
+                    break
+                
+            return ''.join(workarea[mark:])
+        finally:
+            del workarea[mark:]
+
+    def rewrites_workarea(self):
+        """True if some node of the group may rewrite the output
+        written before it (the % spacer), in which case nodes are
+        given a copy of the workarea.
+        """
+        try:
+            return self.rewrites
+        except AttributeError:
+            self.rewrites = any(isinstance(node, Spacer) and node.value == '%'
+                                for node in iter_nodes(self.value))
+            return self.rewrites
 
 
     def max_repeat(self, record):
@@ -751,40 +796,14 @@ class Ref(LeafNode):
                 else:
                     dbase = self.dbase
                 # cross-database reference, fetch foreign record
-                if '.' in dbase:
-                    # given collection.database
-                    collection_name, db_name = dbase.split('.')
-                else:
-                    # given just database
-                    db_name = dbase
-                    collection_name = mst.collection_name
-
-                #try cache first    
-                try:
-                    fcache = _ref_record_cache[dbase]
-                except KeyError:
-                    fcache = _ref_record_cache[dbase] = {}
+                # trying the cache first
+                fcache = _ref_record_cache.setdefault(ref_key(mst, dbase), {})
                 try:
                     new_record = fcache[record_mfn]
-                except KeyError:                    
-                    try:
-                        #Current database
-                        target_mst = engine.Engine.collection[collection_name][db_name]
-                        new_record = target_mst[record_mfn]
-                        _ref_record_cache[dbase][record_mfn] = new_record
-                    except:
-                        #Open mst file
-                        fname = search_path(mst, dbase, 'mst')
-                        if not fname:
-                            raise Exception (_("Data base does not exist"))
-                    
-                        config = pyisis.config.config
-                        fconfname = fname.replace('.mst','.ini')
-                        if exists(fconfname):
-                            config.load(fconfname)
-                        target_mst = pyisis.files.MasterFile(fname,config=config)
-                        new_record = target_mst[record_mfn]
-                        _ref_record_cache[dbase][record_mfn] = new_record
+                except KeyError:
+                    target_mst = ref_database(mst, dbase, chain)
+                    new_record = target_mst[record_mfn]
+                    fcache[record_mfn] = new_record
             else:
                 # use same database present in the given record
                 new_record = mst[record_mfn]
@@ -795,12 +814,100 @@ class Ref(LeafNode):
             raise BreakException(value='')
         temp_wa = copy(workarea)
         LeafNode.ref_chain = True
-        temp_result = format_chain(new_record, mst, flatten(self.pft) , debug, temp_wa)
+        temp_result = format_chain(new_record, mst, flatten(self.pft) , debug, temp_wa,
+                                   mst_pool=getattr(chain, 'mst_pool', None))
         LeafNode.ref_chain = False
         result = temp_result[len(''.join(workarea)):] 
         return result
 
 
+def ref_key(mst, dbase):
+    """Key of the database named dbase in a ref() call from mst.
+    The same name may refer to databases under different paths."""
+    return (getattr(mst, 'basepath', ''), dbase)
+
+
+def ref_database(mst, dbase, chain):
+    """Return the MasterFile referenced by dbase in a ref() call.
+    Databases are looked up in the collections first and then in the
+    search path, and once found they are kept open in the pool of the
+    formatting chain (usually the pool of the session).
+    """
+    mst_pool = getattr(chain, 'mst_pool', None)
+    if mst_pool is None:
+        mst_pool = _ref_mst_pool
+    key = ref_key(mst, dbase)
+    try:
+        return mst_pool[key]
+    except KeyError:
+        pass
+
+    if '.' in dbase:
+        # given collection.database
+        collection_name, db_name = dbase.split('.')
+    else:
+        # given just database
+        db_name = dbase
+        collection_name = mst.collection_name
+    try:
+        target_mst = engine.Engine.collection[collection_name][db_name]
+    except Exception:
+        #Open mst file
+        fname = search_path(mst, dbase, 'mst')
+        if not fname:
+            raise Exception (_("Data base does not exist"))
+        # MasterFile itself applies the <database>.ini found beside it
+        target_mst = pyisis.files.MasterFile(fname, config=pyisis.config.config)
+    mst_pool[key] = target_mst
+    return target_mst
+
+
+def prefetch_refs(chain, records, mst, mst_pool=None):
+    """Read in advance all cross-database records referenced by the
+    ref() calls of chain for the given batch of records.
+    The MFNs are gathered across the whole batch and each target
+    master file is read once per record in physical (block) order,
+    filling the cache used by Ref.eval.
+    """
+    refs = [node for node in iter_nodes(chain)
+            if isinstance(node, Ref) and node.dbase is not None]
+    if not refs:
+        return
+
+    wanted = {}
+    reset_chain(chain)
+    chain.mst_pool = mst_pool
+    for record in records:
+        for node in refs:
+            try:
+                if isinstance(node.dbase, str):
+                    dbase = node.dbase
+                else:
+                    dbase = node.dbase.eval(record, mst, [], chain, 0).strip()
+                record_mfn = node.value.eval(record, mst, [], chain, 0)
+            except Exception:
+                # keys that depend on the formatting context are
+                # simply resolved later by Ref.eval
+                continue
+            fcache = _ref_record_cache.setdefault(ref_key(mst, dbase), {})
+            if record_mfn not in fcache:
+                wanted.setdefault(dbase, set()).add(record_mfn)
+
+    for dbase, keys in wanted.items():
+        try:
+            target_mst = ref_database(mst, dbase, chain)
+            positions = []
+            for record_mfn in keys:
+                status, position = target_mst._get_record_offset(int(record_mfn))
+                positions.append((position, record_mfn))
+        except Exception:
+            continue
+        positions.sort()
+        fcache = _ref_record_cache[ref_key(mst, dbase)]
+        for position, record_mfn in positions:
+            fcache[record_mfn] = target_mst[record_mfn]
+
+
 class Select(LeafNode):
     def __init__(self, expr, optlist, elsecase=None):
         self.expr       = expr
@@ -836,103 +943,139 @@ def procgizmo(filename, record, reclist):
     """  
     try:
         tags = [int(rec) for rec in reclist.split(',') if rec]
-        gizmo = {}
-        config = pyisis.config.config
-        try:
-            config.load('%s.ini' % filename)
-        except:
-            pass
-        gsplit_mst = pyisis.files.MasterFile('%s.mst' % filename, config=config)
+        gizmo = pyisis.gizmo.load('%s.mst' % filename)
 
-        for grecord in gsplit_mst:
-            gizmo[grecord[1].data] = grecord[2].data
-        
         for tag in tags:
-            data = record[tag].data
-            for key, streplace in gizmo.items():
-                data = data.replace(key,streplace)
-            record[tag].data = data
+            field = record[tag]
+            if isinstance(field, MasterContainerField):
+                occurrences = field
+            else:
+                occurrences = [field]
+            for occurrence in occurrences:
+                occurrence.data = gizmo.translate(occurrence.data)
     
     except Exception, e:
         print str(e)
     return record
 
 
-class Proc(LeafNode):
-    """Append, Delete or replace data fields in the current record"""
+def parse_proc(text):
+    """Convert the text produced by the argument of proc() into
+    a list of (command, params) pairs. Commands are ordered the
+    way they are applied: gizmos, gsplits, deletes, adds and hadds.
+    """
+    commands = []
+    for fname, tags, tag in proc_filter_gizmo.findall(text):
+        commands.append(('gizmo', (fname, tags)))
+
+    for clean_cmd, tag, char in proc_filter_gsplit.findall(text):
+        commands.append(('gsplit', (bool(clean_cmd), int(tag), char)))
+
+    for fieldocc, field, allfields in proc_filter_delete.findall(text):
+        if allfields:
+            commands.append(('clear', ()))
+            # nothing else is left to be deleted
+            break
+        elif field:
+            commands.append(('delete', (int(field),)))
+        elif fieldocc:
+            field, occ = fieldocc.split('/')
+            commands.append(('delete_occ', (int(field), int(occ))))
+
+    for field, value in proc_filter_add.findall(text):
+        commands.append(('add', (int(field), value)))
+
+    for field, size, data in proc_filter_hadd.findall(text):
+        fmt = '%%-%ds' % int(size)
+        commands.append(('add', (int(field), fmt % data)))
+    return commands
+
+
+def _proc_gizmo(record, fname, tags):
+    procgizmo(fname, record, tags)
+
+def _proc_gsplit(record, clean_cmd, tag, char):
+    data = record[tag].data.split(char)
+    if clean_cmd:
+        data = [word.strip() for word in data]
+    record[tag].data = ''.join(data)
+
+def _proc_clear(record):
+    record.clear()
+
+def _proc_delete(record, tag):
+    try:
+        del record[tag]
+    except KeyError:
+        pass
 
-    def eval(self, record, mst, workarea, chain, pos, occ=0, debug=False):
-        
-        def add_field(record, field, value):
-            mf = MasterField(field,value)
-            if record.has_key(field):
-                if type(record[field]) is MasterContainerField:
-                    record[field].append(mf)
-                else:
-                    oldmf = record[field]
-                    record[field] = MasterContainerField(field,[oldmf,mf])
-            else:
-                record[field] = mf    
-            return record[field]    
-            
-        result = ''
-        LeafNode.proc_chain = True
-        for node in self.value:
-            try:
-                result += node.eval(record, mst, workarea, chain, pos, occ, debug)
-            except:
-                pass
-        LeafNode.proc_chain = False
+def _proc_delete_occ(record, tag, occ):
+    try:
+        del record[tag][occ-1]
+    except KeyError:
+        pass
 
-        #Applies gizmo
-        gizmo_cmds = proc_filter_gizmo.findall(result)
-        for fname, tags, tag in gizmo_cmds:
-            record = procgizmo(fname, record, tags)
+def _proc_add(record, tag, value):
+    mf = MasterField(tag, value)
+    try:
+        field = dict.__getitem__(record, tag)
+    except KeyError:
+        record[tag] = mf
+    else:
+        if type(field) is MasterContainerField:
+            field.append(mf)
+        else:
+            record[tag] = MasterContainerField(tag, [field, mf])
 
-        #Applies gsplit char
-        gsplit_cmds = proc_filter_gsplit.findall(result)
-        for clean_cmd, tag, char in gsplit_cmds:
-            data = record[int(tag)].data.split(char)
-            result = ''
-            for word in data:
-                if clean_cmd:
-                    result += word.strip()
-                else:
-                    result += word
-            record[int(tag)].data = result
-        
-        #Applies field delete command
-        deletecmds = proc_filter_delete.findall(result)
-        for fieldocc, field, allfields in deletecmds:
-            try:
-                if allfields:
-                    record.clear()
-                    break
+proc_handlers = {'gizmo': _proc_gizmo,
+                 'gsplit': _proc_gsplit,
+                 'clear': _proc_clear,
+                 'delete': _proc_delete,
+                 'delete_occ': _proc_delete_occ,
+                 'add': _proc_add,
+                 }
 
-                elif field:
-                    del record[int(field)]
+def apply_proc(record, commands):
+    """Apply the commands returned by parse_proc() to the record."""
+    for command, params in commands:
+        proc_handlers[command](record, *params)
 
-                elif fieldocc:
-                    field, occ = fieldocc.split('/')
-                    del record[int(field)][int(occ)-1]
 
-            except KeyError:
-                pass
-        
-        #Applies field add command
-        add_tags = proc_filter_add.findall(result)
-        for field,value in add_tags:
-            field = int(field)
-            record[field] = add_field(record, field, value)
-
-        #Applies field add command
-        h_add_tags = proc_filter_hadd.findall(result)
-        for field, size, data in h_add_tags:
-            field = int(field)
-            fmt = '%%-%ds' % int(size)
-            value = fmt % data            
-            record[field] = add_field(record, field, value)
+class Proc(LeafNode):
+    """Append, Delete or replace data fields in the current record"""
+
+    def __init__(self, value):
+        LeafNode.__init__(self, value)
+        # When the argument has only literals, its commands are parsed
+        # once for each (mode, case) pair instead of once per record.
+        self.constant = all(self._is_literal(node) for node in value)
+        self.commands = {}
+
+    @staticmethod
+    def _is_literal(node):
+        if isinstance(node, Sequence):
+            return all(isinstance(i, InconditionalLiteral) for i in node)
+        # items that are not nodes (parenthesis, empty commas) are ignored
+        return isinstance(node, InconditionalLiteral) or not isinstance(node, Node)
+
+    def eval(self, record, mst, workarea, chain, pos, occ=0, debug=False):
+        key = (chain.mode, chain.case)
+        try:
+            commands = self.commands[key]
+        except KeyError:
+            result = ''
+            LeafNode.proc_chain = True
+            for node in self.value:
+                try:
+                    result += node.eval(record, mst, workarea, chain, pos, occ, debug)
+                except:
+                    pass
+            LeafNode.proc_chain = False
+            commands = parse_proc(result)
+            if self.constant:
+                self.commands[key] = commands
 
+        apply_proc(record, commands)
         #record.save(mst)
         return ''
 
@@ -2199,41 +2342,80 @@ def break_line(line, max_width, spaces=''):
     longer than max_width. Lines are broken at word boundaries.
     If the line is smaller than max_width (or max_width==0), the line
     is returned as the single element of the resulting list.
+    Continuation pieces start with the given spaces.
     """
     if len(line) <= max_width or max_width <= 0: #and line[-1]=='.':
         # Do not apply line breaking algorithm
         # max_width can be negative if the config.MAX_LINE_WIDTH is
         # set to zero
         return [line,]
-    
-    else:
-        result = []
-        cut_pos = line.rfind(SINGLESPACE, 0, max_width+1)
+
+    result = []
+    # The text still to be broken is head+line[offset:], where head
+    # holds the spaces (or what is left of them) that start the
+    # current piece. Only a window of max_width+2 characters is
+    # copied at each step.
+    head = ''
+    offset = 0
+    size = len(line)
+    remaining = size
+    stalled = 0
+    while remaining > max_width:
+        window = head + line[offset:offset+max_width+2]
+        cut_pos = window.rfind(SINGLESPACE, 0, max_width+1)
         #to break in two spaces
-        try:
-            if line[cut_pos+1] == SINGLESPACE:
-                cut_pos = line[:cut_pos].rfind(SINGLESPACE, 0, max_width+1)
-        except:
-            pass
+        if cut_pos+1 < len(window) and window[cut_pos+1] == SINGLESPACE:
+            if cut_pos < 0:
+                end = remaining - 1
+            else:
+                end = cut_pos
+            cut_pos = window[:end].rfind(SINGLESPACE, 0, max_width+1)
         if cut_pos <= 0:
            # handle special case of unbreakable long string
             cut_pos = max_width
 
-        if line[:cut_pos].strip() == '':
+        if window[:cut_pos].strip() == '':
             cut_pos = max_width - 1
-        
-        result.append(line[:cut_pos+1])
-        rest = spaces+line[cut_pos+1:]
-        if rest:
-            result.extend(break_line(rest, max_width, spaces))
-        return result
+
+        result.append(window[:cut_pos+1])
+        consumed = cut_pos + 1
+        if consumed <= len(head):
+            head = spaces + head[consumed:]
+        else:
+            offset += consumed - len(head)
+            head = spaces
+
+        previous, remaining = remaining, len(head) + size - offset
+        if remaining >= previous:
+            # indentation wider than the line, avoid looping forever
+            stalled += 1
+            if stalled > sys.getrecursionlimit():
+                raise RuntimeError("Unable to break line at width %d" % max_width)
+        else:
+            stalled = 0
+
+    if remaining:
+        result.append(head + line[offset:])
+    return result
+
+
+def reset_chain(chain):
+    """Set the mode params of the chain to their initial values."""
+    # default mpl - proof mode, data left unchanged
+    chain.mode = 'p'
+    chain.case = 'l'
+    chain.variables = {} # dict to hold evaluated variables
+    chain.summary = None
+    chain.branch = False
+    chain.dont_apply_format = False
 
 
-def format_chain(rec, mst, chain, debug=False, workarea=[]):
+def format_chain(rec, mst, chain, debug=False, workarea=[], mst_pool=None):
     """Function that processes every node in the chain
     and applies formatting to the mst and record given.
     Each node is responsible to insert its representation into
     the given workarea(list of strings).
+    The mst_pool is a dict where databases opened by ref() are kept.
     """
     if mst is None:
         # try Master from record
@@ -2250,13 +2432,8 @@ def format_chain(rec, mst, chain, debug=False, workarea=[]):
         local_workarea = workarea
     else:
         local_workarea = []
-    # default mpl - proof mode, data left unchanged
-    chain.mode = 'p'
-    chain.case = 'l'
-    chain.variables = {} # dict to hold evaluated variables
-    chain.summary = None
-    chain.branch = False
-    chain.dont_apply_format = False
+    reset_chain(chain)
+    chain.mst_pool = mst_pool
     sweepRepeatableLiteral(rec, mst, local_workarea, chain, occ=0, debug=debug)
     for pos, node in enumerate(chain):
         if isinstance(node, RepeatableLiteral):
@@ -2268,6 +2445,17 @@ def format_chain(rec, mst, chain, debug=False, workarea=[]):
     return output
 
 
+def restore_workarea(workarea, size, last):
+    """Undo the changes made to the workarea by a node evaluated inside
+    a RepeatableGroup: drop what was appended after size and put back
+    the last item, which a conditional literal may have replaced.
+    """
+    if size and (len(workarea) < size or workarea[size-1] is not last):
+        workarea[size-1:] = [last]
+    else:
+        del workarea[size:]
+
+
 def sweepRepeatableLiteral(rec, mst, workarea, chain, occ=0, debug=False):
     """Sweep all Repeatable and Conditional literal elements to set field reference
     """
@@ -2280,6 +2468,42 @@ def sweepRepeatableLiteral(rec, mst, workarea, chain, occ=0, debug=False):
         pass
 
 
+def iter_nodes(node):
+    """Generator that visits every node of the tree under node,
+    including the nodes held as attributes (conditions, parameters,
+    sub-formats) of other nodes. Each node is visited once.
+    """
+    seen = set()
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, (list, tuple)):
+            pending.extend(reversed(node))
+        if isinstance(node, Node):
+            yield node
+        if isinstance(node, (Node, Sequence)):
+            pending.extend(value for value in vars(node).values()
+                           if isinstance(value, (Node, list, tuple)))
+
+
+def required_tags(chain):
+    """Return the frozenset of tags read from the record by the chain,
+    found in its Field nodes (including those used as parameters of
+    functions). ref() and proc() may need any field, so None is returned
+    for chains containing them, meaning that the whole record is needed.
+    """
+    tags = set()
+    for node in iter_nodes(chain):
+        if isinstance(node, (Ref, Proc)):
+            return None
+        if isinstance(node, Field):
+            tags.add(node.value['tag'])
+    return frozenset(tags)
+
+
 def decorate(node, func):
     """Recursively browse the tree applying func to all nodes
     """
@@ -2328,7 +2552,9 @@ class PftCompiler(object):
 
     def compile_code(self, chain):
         """Create a formatting function that holds the chain"""
-        def f(rec, mst, debug=False):
+        def f(rec, mst, debug=False, mst_pool=None):
             _chain = chain
-            return format_chain(rec, mst, _chain, debug)
+            return format_chain(rec, mst, _chain, debug, mst_pool=mst_pool)
+        f.chain = chain
+        f.required_tags = required_tags(chain)
         return f
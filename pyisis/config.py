@@ -50,6 +50,10 @@ class Config(object):
         self.POINTER_SIZE = 4
         self.LAST_XRF_BLOCK = -1
         self.PARSER_AUXFILES_DIR = tempfile.gettempdir()
+        # Directory shared by processes to store compiled formats
+        # (empty string disables the on-disk cache). Its entries are
+        # unpickled, so it must only be writable by trusted users
+        self.FORMAT_CACHE_DIR = ''
         self.YACC_DEBUG = False
         self.LOG_LEVEL = logging.DEBUG
         self.LOG_PATH = join(tempfile.gettempdir(), "pymx.log")
@@ -203,6 +207,9 @@ class Config(object):
         # Temporary directory for parser files
         self._safe_set('PARSER_AUXFILES_DIR', cfg, 'Engine','PARSER_AUXFILES_DIR')
 
+        # Directory for the on-disk cache of compiled formats
+        self._safe_set('FORMAT_CACHE_DIR', cfg, 'Engine','FORMAT_CACHE_DIR')
+
         # Path where to generate log files
         self._safe_set('LOG_PATH', cfg, 'Engine','LOG_PATH')
 
@@ -2,7 +2,7 @@
 Definition of data files that belong to ISIS CDS/ISIS 1989
 """
 
-__updated__ = "2009-07-30"
+__updated__ = "2026-10-18"
 __created__ = "2007-01-25"
 __author__  = "Rodrigo Senra <rsenra@acm.org>"
 
@@ -13,12 +13,13 @@ from struct import unpack, pack, calcsize
 from glob import glob
 from logging import debug, info, warning, error
 from itertools import imap
-from unicodedata import normalize, category
+from unicodedata import category
 import re
 
 import pyisis.session
 import pyisis.config
 import pyisis.engine
+from pyisis.folding import fold, fold_text
 from pyisis.records import MasterRecord, XrfRecord, ACTIVE, LOGICALLY_DELETED
 
 #from ZODB import FileStorage, DB
@@ -255,6 +256,47 @@ class PostIndex(object):
     field:%s"""%(self.mfn,self.extraction_id,self.occ,self.offset,self.technique,self.fieldno)
 
 
+class FieldProfile(object):
+    """Statistics of the occurrences of a tag in a master file,
+    gathered by MasterFile.profile()"""
+    def __init__(self, tag):
+        self.tag                = tag
+        # records having the tag and occurrences in all of them
+        self.records            = 0
+        self.occurrences        = 0
+        # most occurrences in a single record
+        self.max_repeat         = 0
+        # lengths in bytes; the histogram maps the smallest power
+        # of 2 not lower than the length to the number of occurrences
+        self.max_length         = 0
+        self.total_length       = 0
+        self.lengths            = {}
+        # subfield codes, u'' for the text before the first delimiter,
+        # and the codes found more than once in an occurrence
+        self.subfields          = set()
+        self.repeated_subfields = set()
+
+    def add(self, length):
+        self.occurrences += 1
+        self.total_length += length
+        if length > self.max_length:
+            self.max_length = length
+        bucket = length and 1 << (length - 1).bit_length()
+        self.lengths[bucket] = self.lengths.get(bucket, 0) + 1
+
+    @property
+    def repeatable(self):
+        return self.max_repeat > 1
+
+    @property
+    def mean_length(self):
+        return self.occurrences and float(self.total_length) / self.occurrences
+
+    def __repr__(self):
+        return "<FieldProfile tag:%s records:%s occurrences:%s>" % \
+               (self.tag, self.records, self.occurrences)
+
+
 class MasterFile(object):
     """Encapsulates a traditional CSD/ISIS Master File.
     Holds the control information for the file.
@@ -269,6 +311,8 @@ class MasterFile(object):
     151
     >>> len(mf)
     150
+    >>> [rec.mfn for rec in mf[1:4]]
+    [1, 2, 3]
     """
     def __init__(self, filepath,
                  mftype=0, collection_name='', config=None):
@@ -390,10 +434,20 @@ class MasterFile(object):
        """Apply formatting expression to the given record"""
        if type(record) is int: # given just mfn
            record = self[record]
-       return pyisis.session.format(self, record, expr)
+       return pyisis.session.format(expr, record, mst=self)
     # Create alias function .pft() == .format()
     pft = format
 
+    def format_to(self, stream, expr, records=None):
+       """Apply formatting expression to the given records, or to all
+       records of the master file, writing the output to stream.
+       """
+       if records is None:
+           # read only the fields used by the expression
+           tags = pyisis.session.required_tags(expr, mst=self)
+           records = self.iterrecords(tags)
+       return pyisis.session.format_to(stream, expr, records, mst=self)
+
     def _write_control(self):
         """Persist the instance attribute values that correspond
         to the control header field in the file.
@@ -460,6 +514,73 @@ class MasterFile(object):
         #for mfn in range(1, self.nxtmfn):
         #    yield self.__getitem__(mfn)
 
+    def iterrecords(self, tags=None):
+        """Iterate over all records, decoding only the fields
+        with the given tags (all fields if tags is None).
+        """
+        return imap(lambda mfn: self.fetch(mfn, tags), xrange(1, self.nxtmfn))
+
+    def profile(self, subfields=True, deleted=False):
+        """Single pass over the master file gathering the statistics
+        of each tag from the leaders and directories of the records.
+        Field data is read only to find the subfield codes, and not
+        decoded; with subfields=False it is skipped.
+        Logically deleted records are included if deleted is True.
+        Returns the pair (records, fields), the number of records read
+        and the dict mapping each tag to its FieldProfile.
+        """
+        fd = self.mst_fd
+        leader_size = self.LEADER_SIZE
+        dir_size = self.config.DIR_SIZE
+        dir_entry = self.config.DIR_MASK.replace(self.config.BYTE_ORDER_PRFIX, "")
+        delimiter = self.config.SUBFIELD_DELIMITER
+        encoding = self.config.INPUT_ENCODING
+        accepted = deleted and ('active', 'logically deleted') or ('active',)
+        fields = {}
+        records = 0
+        for mfn in xrange(1, self.nxtmfn):
+            status, pos = self._get_record_offset(mfn)
+            if status not in accepted:
+                continue
+            fd.seek(pos)
+            leader = unpack(self.LEADER_MASK, fd.read(leader_size))
+            mfrl, base, nvf = leader[1], leader[-3], leader[-2]
+            directory = unpack(self.config.BYTE_ORDER_PRFIX + nvf * dir_entry,
+                               fd.read(nvf * dir_size))
+            if subfields:
+                data = fd.read(mfrl - base)
+            records += 1
+            repeats = {}
+            for entry in range(0, len(directory), 3):
+                tag, start, length = directory[entry:entry+3]
+                tag = tag & 0xffff
+                field = fields.get(tag)
+                if field is None:
+                    field = fields[tag] = FieldProfile(tag)
+                field.add(length)
+                repeats[tag] = repeats.get(tag, 0) + 1
+                if not subfields:
+                    continue
+                # same split as MasterField._get_subfields
+                value = data[start:start+length]
+                if not value.startswith(delimiter):
+                    value = delimiter + " " + value
+                codes = set()
+                for part in value.split(delimiter):
+                    if not part:
+                        continue
+                    code = part[:1].decode(encoding, 'replace').lower().strip()
+                    if code in codes:
+                        field.repeated_subfields.add(code)
+                    codes.add(code)
+                field.subfields.update(codes)
+            for tag, count in repeats.iteritems():
+                field = fields[tag]
+                field.records += 1
+                if count > field.max_repeat:
+                    field.max_repeat = count
+        return records, fields
+
     def __len__(self):
         """Number of active records in the master file,
         *excluding* deleted records. This will wake up all blocks
@@ -490,37 +611,37 @@ class MasterFile(object):
         return (status, pos)
 
 
+    def fetch(self, mfn, tags=None):
+        """Routine that fetches a record given its mfn number.
+        mfn is converted to int. If the record is either
+        'invalid', 'inexistent' or 'physically deleted' then
+        empty record with correct status value is returned.
+        If tags is given, only the fields with those tags are read.
+        """
+        mfn = int(mfn)
+        status, pos = self._get_record_offset(mfn)
+        if status in ('active',  'logically deleted'):
+            self.mst_fd.seek(pos)
+            rec = MasterRecord(mfn=mfn,
+                               status=status,
+                               config=self.config)
+            rec.read(self, tags)
+            # set master
+            rec.mst = self
+            return rec
+        if status in ('physically deleted'):
+            rec = MasterRecord(mfn=mfn, status=status, config=self.config)
+            rec.mst = self
+            return rec
+        if status in ('invalid', 'inexistent'):
+            return None
+
     def __getitem__(self, mfn):
-        """Uses _fetch to read a record from the master file
+        """Uses fetch to read a record from the master file
         given its MFN.
         """
-        def fetch(mfn):
-            """Routine that fetches a record given its mfn number.
-            mfn is converted to int. If the record is either
-            'invalid', 'inexistent' or 'physically deleted' then
-            empty record with correct status value is returned.
-            """
-            mfn = int(mfn)
-            status, pos = self._get_record_offset(mfn)
-            if status in ('active',  'logically deleted'):
-                self.mst_fd.seek(pos)
-                rec = MasterRecord(mfn=mfn,
-                                   status=status,
-                                   config=self.config)
-                rec.read(self)
-                # set master
-                rec.mst = self
-                return rec
-            if status in ('physically deleted'):
-                rec = MasterRecord(mfn=mfn, status=status, config=self.config)
-                rec.mst = self
-                return rec
-            if status in ('invalid', 'inexistent'):
-                return None
-
-
         try:
-            return fetch(mfn)
+            return self.fetch(mfn)
         except TypeError, ex:
             # Optimized out: if type(mfn)==slice:
             result_set = []
@@ -540,7 +661,7 @@ class MasterFile(object):
                 step = mfn.step
 
             for idx in range(start, stop, step):
-                result_set.append(fetch(idx))
+                result_set.append(self.fetch(idx))
             return result_set
 
     #def __setitem__(self, mfn, record):
@@ -810,7 +931,7 @@ class MasterFile(object):
                     for key in mdata:
                         key = key.replace('<','').replace('>','').strip()
                         offset = get_offset_field(key,field.data)
-                        fkey = prefix + normalize('NFKD', key.decode(self.config.OUTPUT_ENCODING)).encode('ascii','ignore').upper()
+                        fkey = prefix + fold(key.decode(self.config.OUTPUT_ENCODING)).upper()
                         fkey_word = fkey[:60].strip()
                         putpost(root, fkey_word, mfn_num, fst_extraction_id, occ, offset,
                                 fst_technique, field_tag)
@@ -826,7 +947,7 @@ class MasterFile(object):
                             continue
                         fkey = ''
                         word = unicode(word.decode(self.config.OUTPUT_ENCODING))
-                        key = normalize('NFKD', word).encode('ascii','ignore').upper()
+                        key = fold(word).upper()
                         for letter in key:
                             if category(unicode(letter)) in ('Ll','Lu'):
                                 fkey += letter
@@ -852,7 +973,7 @@ class MasterFile(object):
                     #field ipsis-literis
                     #
                     if fst_technique in ('0','1000'):
-                        fkey = prefix + normalize('NFKD', fdata.decode(self.config.OUTPUT_ENCODING)).encode('ASCII','ignore').upper()
+                        fkey = prefix + fold_text(fdata.decode(self.config.OUTPUT_ENCODING)).upper()
                         offset = get_offset_field(fdata,field.data)
                         fkey_word = fkey[:60].strip()
                         putpost(root, fkey_word, mfn_num, fst_extraction_id, occ,
@@ -875,7 +996,7 @@ class MasterFile(object):
                         for delim,subfield in pairs:
                             offset = get_offset_field(subfield,field.data)
                             key = unicode(subfield.strip()).encode(self.config.OUTPUT_ENCODING)
-                            fkey = prefix + normalize('NFKD', key.decode(self.config.OUTPUT_ENCODING)).encode('ascii','ignore').upper()
+                            fkey = prefix + fold(key.decode(self.config.OUTPUT_ENCODING)).upper()
                             fkey_word = fkey[:60].strip()
                             putpost(root, fkey_word, mfn_num, fst_extraction_id, occ,
                                     offset, fst_technique, field_tag)
@@ -897,7 +1018,7 @@ class MasterFile(object):
             key:      key value,
             filename: inverted file name
         """
-        key = normalize('NFKD', key.decode(mst.config.INPUT_ENCODING)).encode('ASCII','ignore').upper()[:60]
+        key = fold(key.decode(mst.config.INPUT_ENCODING)).upper()[:60]
 
         try:
             fcache = _cache[filename]
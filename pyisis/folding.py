@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Accent folding of index keys.
+
+fold_text(text) returns the same as
+    normalize('NFKD', text).encode('ascii', 'ignore')
+but decomposes each character only once per process: characters are
+mapped through a unicode.translate table, prepared for the Latin ranges
+found in CDS/ISIS databases (cp850 and latin-1) and extended on demand
+with any other character. fold(token) also memoizes the folded tokens
+and fold_many(tokens) folds the tokens of a field in a single pass.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import re
+import sys
+from unicodedata import normalize
+
+# Latin-1 Supplement, Latin Extended-A and Latin Extended-B,
+# which include every letter of cp850 and latin-1
+PRECOMPUTED_RANGE = 0x250
+
+# Folded tokens kept in the memo before it is cleared
+CACHE_SIZE = 100000
+
+# Separator of the texts folded together by fold_many,
+# no character folds into it
+BATCH_SEPARATOR = u'\n'
+
+
+def _fold_char(char):
+    return normalize('NFKD', char).encode('ascii', 'ignore').decode('ascii')
+
+
+class FoldingTable(dict):
+    """Translate table mapping code points to their folded text.
+    Characters not in the table are folded and added when found."""
+    def __missing__(self, codepoint):
+        folded = self[codepoint] = _fold_char(unichr(codepoint))
+        return folded
+
+table = FoldingTable((codepoint, _fold_char(unichr(codepoint)))
+                     for codepoint in range(PRECOMPUTED_RANGE))
+
+if sys.maxunicode == 0xFFFF:
+    # narrow builds hold characters outside the BMP as surrogate pairs,
+    # which can not be folded one code unit at a time
+    surrogate_pat = re.compile(u'[\ud800-\udfff]')
+else:
+    surrogate_pat = None
+
+# Maps text to folded text
+_cache = {}
+
+
+def fold_text(text):
+    """Return the text (unicode or ASCII str) without accents and
+    other non ASCII characters, as an ASCII str. Used for whole
+    fields, which are not memoized."""
+    if type(text) is not unicode:
+        text = unicode(text)
+    if surrogate_pat is not None and surrogate_pat.search(text):
+        return normalize('NFKD', text).encode('ascii', 'ignore')
+    return text.translate(table).encode('ascii')
+
+
+def fold(text):
+    """Same as fold_text, for tokens and keys, which
+    are memoized since they repeat a lot."""
+    try:
+        return _cache[text]
+    except KeyError:
+        pass
+    folded = fold_text(text)
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[text] = folded
+    return folded
+
+
+def fold_many(texts):
+    """Return the list of folded texts (for example all words of a
+    field). Texts not found in the memo are folded together with a
+    single translate call.
+    """
+    result = [_cache.get(text) for text in texts]
+    missing = [idx for idx, folded in enumerate(result) if folded is None]
+    if not missing:
+        return result
+    joined = BATCH_SEPARATOR.join([texts[idx] for idx in missing])
+    if joined.count(BATCH_SEPARATOR) != len(missing) - 1:
+        # some text has the separator itself
+        folded_texts = [fold_text(texts[idx]) for idx in missing]
+    else:
+        folded_texts = fold_text(joined).split(BATCH_SEPARATOR.encode('ascii'))
+    if len(_cache) + len(missing) >= CACHE_SIZE:
+        _cache.clear()
+    for idx, folded in zip(missing, folded_texts):
+        result[idx] = _cache[texts[idx]] = folded
+    return result
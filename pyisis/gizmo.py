@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gizmo tables used by proc() to convert field data.
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import re
+from os import stat
+from os.path import abspath, splitext
+
+import pyisis.config
+import pyisis.files
+
+# Maps absolute path of the gizmo .mst to (mtime, GizmoTable)
+_cache = {}
+
+
+class GizmoTable(object):
+    """Replacement table loaded from a gizmo database, where
+    field 1 holds the text to be found and field 2 its replacement.
+
+    All pairs are applied in a single pass over the data. At each
+    position the longest matching key is replaced and the scan goes on
+    after it, so the cost is proportional to the length of the data and
+    not to the number of entries of the table.
+    """
+    def __init__(self, pairs):
+        self.table = dict((key, value) for key, value in pairs if key)
+        if not self.table:
+            self.translate = lambda data: data
+        elif max(len(key) for key in self.table) == 1:
+            # character to string conversion is done by unicode.translate
+            charmap = dict((ord(key), value) for key, value in self.table.items())
+            self.translate = lambda data: data.translate(charmap)
+        else:
+            self.pattern = re.compile(self._trie_pattern(self._build_trie()), re.U)
+            self._replace = lambda match: self.table[match.group(0)]
+
+    def _build_trie(self):
+        """Build a nested dict trie with all keys of the table.
+        The empty string key marks the end of a key.
+        """
+        trie = {}
+        for key in self.table:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = True
+        return trie
+
+    def _trie_pattern(self, node):
+        """Convert the trie into a regular expression without
+        alternations sharing prefixes. Optional groups are greedy,
+        so the longest key wins."""
+        terminal = '' in node
+        branches = []
+        for char in sorted(node):
+            if char:
+                branches.append(re.escape(char) + self._trie_pattern(node[char]))
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            pattern = branches[0]
+        else:
+            pattern = '(?:%s)' % '|'.join(branches)
+        if terminal:
+            pattern = '(?:%s)?' % pattern
+        return pattern
+
+    def translate(self, data):
+        """Return data with all keys of the table replaced."""
+        return self.pattern.sub(self._replace, data)
+
+    def __len__(self):
+        return len(self.table)
+
+
+def _mtime(filepath):
+    """Modification time of the gizmo database files."""
+    name = splitext(filepath)[0]
+    try:
+        xrf_mtime = stat(name + '.xrf').st_mtime
+    except OSError:
+        xrf_mtime = 0
+    return max(stat(filepath).st_mtime, xrf_mtime)
+
+
+def load(filepath, config=None):
+    """Return the GizmoTable stored in the given .mst file.
+    Tables are compiled once and reused until the file changes.
+    """
+    filepath = abspath(filepath)
+    mtime = _mtime(filepath)
+    try:
+        cached_mtime, table = _cache[filepath]
+        if cached_mtime == mtime:
+            return table
+    except KeyError:
+        pass
+
+    if config is None:
+        config = pyisis.config.config
+    # a <gizmo>.ini beside the database is applied by MasterFile
+    mst = pyisis.files.MasterFile(filepath, config=config)
+    pairs = []
+    for record in mst:
+        if record is None or record.status != 0:
+            continue
+        try:
+            key = record[1].data
+        except KeyError:
+            continue
+        try:
+            value = record[2].data
+        except KeyError:
+            value = u''
+        pairs.append((key, value))
+
+    table = GizmoTable(pairs)
+    _cache[filepath] = (mtime, table)
+    return table
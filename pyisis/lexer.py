@@ -4,7 +4,7 @@
 Handling of formatting language. Lexer.
 """
 
-__updated__ = "2008-10-13"
+__updated__ = "2026-10-18"
 __created__ = "2007-01-21"
 __author__  = "Rodrigo Senra <rsenra@acm.org>"
 
@@ -235,6 +235,7 @@ def t_VFIELD(t):
     # create auxiliary dict to hold field optional attributes
     t.lexer.tagfield = {'tag': int(t.value[1:]),
                         'type':t.value[0].lower()} # type = v or d or n
+    t.lexer.tagfield_lexpos = t.lexpos
     t.lexer.push_state('tagfield')
     if t.lexer.lexdata.endswith(t.value) or t.lexer.lexdata[t.lexer.lexmatch.end()] == ',':
         return finish_tagfield(t)
@@ -315,6 +316,8 @@ def t_tagfield_end(t):
 def finish_tagfield(t):
     t.value = t.lexer.tagfield
     del t.lexer.tagfield
+    # the field token starts at its v/d/n letter
+    t.lexpos = t.lexer.tagfield_lexpos
     t.lexer.pop_state()
     t.type = 'VFIELD'
     return t
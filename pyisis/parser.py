@@ -4,7 +4,7 @@
 Handling of formatting language. Parser.
 """
 
-__updated__ = "2009-07-28"
+__updated__ = "2026-10-18"
 __created__ = "2007-01-21"
 __author__  = "Rodrigo Senra <rsenra@acm.org>"
 
@@ -14,6 +14,16 @@ from pyisis.lexer import tokens
 from pyisis.ast import *
 
 #----- Utilities
+def set_lexpos(p, token_type):
+    """Store in the node built by the production the position in the
+    expression of its first token of the given type. The position
+    identifies the node in profiler reports.
+    """
+    for idx in range(1, len(p)):
+        if p.slice[idx].type == token_type:
+            p[0].lexpos = p.lexpos(idx)
+            return
+
 def decorate_field(root, field):
     """Utility function to decorate every node in the given tree
     with an attribute named 'field' pointing to the given field node.
@@ -149,6 +159,7 @@ def p_repeatablegroup(p):
         if p[idx] not in ('(',',',')',None):
             p[0] = RepeatableGroup(p[idx])
             break
+    set_lexpos(p, 'LPAREN')
     #p[0] = RepeatableGroup(p[2])
 
 
@@ -197,6 +208,7 @@ def p_fieldselector(p):
 def p_field(p):
     """field : VFIELD"""
     p[0] = Field(p[1])
+    set_lexpos(p, 'VFIELD')
 
 
 def p_prefix(p):
@@ -329,22 +341,26 @@ def p_selectstatement(p):
                         | SELECT paramexpr groupcasestatement emptycomma ENDSEL
     """
     p[0] = Select(p[2], p[3])
+    set_lexpos(p, 'SELECT')
 
 def p_selectelsecasestatement(p):
     """ selectstatement : SELECT paramexpr groupcasestatement ELSECASE isisfmt ENDSEL
     """
     p[0] = Select(p[2], p[3], p[5])
+    set_lexpos(p, 'SELECT')
 
 def p_whilestatement(p):
     """ whilestatement : WHILE boolexpr LPAREN isisfmt RPAREN
     """
     p[0] = WhileLoop(p[2], p[4])
+    set_lexpos(p, 'WHILE')
 
 def p_ifstatement(p):
     """ ifstatement : IF boolexpr THEN isisfmt FI
                     | IF boolexpr THEN emptycomma isisfmt FI
     """
     p[0] = Branch(p[2], p[len(p) - 2], None)
+    set_lexpos(p, 'IF')
 
 
 
@@ -367,6 +383,7 @@ def p_ifelsestatement(p):
         p[0] = Branch(p[2], p[5], p[8])
     else:
         p[0] = Branch(p[2], p[4], p[6])
+    set_lexpos(p, 'IF')
 
 
 # Boolean expressions
@@ -447,6 +464,7 @@ def p_procfunc(p):
                 | emptycomma FUNCPROC LPAREN isisfmt RPAREN emptycomma
     """
     p[0] = Proc(p[3:-1])
+    set_lexpos(p, 'FUNCPROC')
 
 
 def p_datefunc(p):
@@ -550,6 +568,7 @@ def p_strfunc_ref(p):
     """ strfunc : FUNCREF LPAREN  paramexpr COMMA isisfmt  RPAREN
     """
     p[0] = Ref(p[3], p[5])
+    set_lexpos(p, 'FUNCREF')
 
 def p_strfunc_ref2(p):
     """ strfunc : FUNCREF LPAREN LBRACKET paramexpr RBRACKET  paramexpr COMMA isisfmt  RPAREN
@@ -560,12 +579,14 @@ def p_strfunc_ref2(p):
         p[0] = Ref(p[4],p[6],p[2].replace('->',''))
     else:
         p[0] = Ref(p[6], p[8], p[4])
+    set_lexpos(p, 'FUNCREF')
 
 
 def p_strfunc_search(p):
     """ numfunc : FUNCSEARCH LPAREN isisfmt  RPAREN
     """
     p[0] = Search(p[3])
+    set_lexpos(p, 'FUNCSEARCH')
 
 def p_strfunc_search2(p):
     """ numfunc : FUNCSEARCH LPAREN LBRACKET paramexpr RBRACKET  isisfmt  RPAREN
@@ -575,17 +596,20 @@ def p_strfunc_search2(p):
         p[0] = Search(p[4],p[2].replace('->',''))
     else:
         p[0] = Search(p[6], p[4])
+    set_lexpos(p, 'FUNCSEARCH')
 
 
 def p_strfunc_npost(p):
     """ numfunc : FUNCNPOST LPAREN isisfmt  RPAREN
     """
     p[0] = Npost(p[3])
+    set_lexpos(p, 'FUNCNPOST')
 
 def p_strfunc_npost2(p):
     """ numfunc : FUNCNPOST LPAREN LBRACKET paramexpr RBRACKET  isisfmt  RPAREN
     """
     p[0] = Npost(p[6], p[4])
+    set_lexpos(p, 'FUNCNPOST')
 
 
 def p_boolfunc(p):
@@ -658,14 +682,18 @@ class PftParser(object):
         """
         if not outputdir:
             outputdir = gettempdir()
-        if parser is None:
-            parser = yacc.yacc(debug=0,
-                               optimize=1,
-                               write_tables=0,
-                               #method="SLR",
-                               outputdir=outputdir)
+        # The parser tables are only built on the first parse, so
+        # processes that find every format in the on-disk cache
+        # never pay for the grammar analysis.
         self._parser = parser
         self._lexer = lexer
+        self._outputdir = outputdir
 
     def parse(self, expr, debug=False):
+        if self._parser is None:
+            self._parser = yacc.yacc(debug=0,
+                                     optimize=1,
+                                     write_tables=0,
+                                     #method="SLR",
+                                     outputdir=self._outputdir)
         return self._parser.parse(expr, lexer=self._lexer, debug=debug)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+Profiling of the formatting language.
+
+The Profiler measures the time spent in each node of the formatting
+chains. It is opt-in: while it is not running the node classes are
+left untouched, so formatting pays nothing for it.
+
+Usage:
+    profiler = Profiler()
+    for record in mst:
+        pyisis.session.format(expr, record, profiler=profiler)
+    profiler.print_report()
+
+or from the command line:
+    python -m pyisis.profiler [options] database.mst expression
+"""
+
+__updated__ = "2026-10-18"
+__created__ = "2026-10-18"
+
+import sys
+from time import time
+import argparse
+
+import pyisis.session
+import pyisis.ast
+
+
+def node_classes():
+    """Return the node classes of the formatting language that
+    implement eval() or format() themselves."""
+    classes = []
+    for value in vars(pyisis.ast).values():
+        if isinstance(value, type) and \
+           issubclass(value, (pyisis.ast.LeafNode, pyisis.ast.Sequence)) and \
+           ('eval' in vars(value) or 'format' in vars(value)):
+            classes.append(value)
+    return classes
+
+
+class Profiler(object):
+    """Collects call counts and times of the nodes evaluated while
+    it is running, keyed by the expression, the node type and the
+    position of the node in the expression (None for nodes whose
+    position is not recorded by the parser).
+
+    For each key the profiler keeps:
+      calls    - number of evaluations of the node
+      tottime  - time spent in the node itself
+      cumtime  - time spent in the node and in the nodes under it
+    """
+    def __init__(self):
+        self.stats = {}
+        self.expr = ''
+        self._running = 0
+        self._patched = []
+        self._stack = []
+        self._active = set()
+
+    def start(self, expr=''):
+        """Start collecting data for the given expression.
+        Calls may be nested, only the outermost one installs the hooks.
+        """
+        self.expr = expr
+        if not self._running:
+            self._install()
+        self._running += 1
+
+    def stop(self):
+        """Stop collecting data, removing the hooks if this
+        is the outermost running call."""
+        self._running -= 1
+        if not self._running:
+            self._uninstall()
+
+    def __enter__(self):
+        self.start(self.expr)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset(self):
+        """Discard the data collected so far."""
+        self.stats.clear()
+
+    def _install(self):
+        for cls in node_classes():
+            for name in ('eval', 'format'):
+                if name in vars(cls):
+                    func = vars(cls)[name]
+                    setattr(cls, name, self._wrap(func))
+                    self._patched.append((cls, name, func))
+
+    def _uninstall(self):
+        while self._patched:
+            cls, name, func = self._patched.pop()
+            setattr(cls, name, func)
+
+    def _wrap(self, func):
+        profiler = self
+        def wrapper(node, *args, **kwargs):
+            # format() usually calls eval() of the same node,
+            # which is accounted only once
+            if id(node) in profiler._active:
+                return func(node, *args, **kwargs)
+            profiler._active.add(id(node))
+            profiler._stack.append(0.0)
+            start = time()
+            try:
+                return func(node, *args, **kwargs)
+            finally:
+                elapsed = time() - start
+                children = profiler._stack.pop()
+                profiler._active.discard(id(node))
+                if profiler._stack:
+                    profiler._stack[-1] += elapsed
+                key = (profiler.expr, node.__class__.__name__,
+                       getattr(node, 'lexpos', None))
+                try:
+                    entry = profiler.stats[key]
+                except KeyError:
+                    entry = profiler.stats[key] = [0, 0.0, 0.0]
+                entry[0] += 1
+                entry[1] += elapsed - children
+                entry[2] += elapsed
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def report(self, by='position', limit=None):
+        """Return the hot spots as a list of tuples
+        (calls, tottime, cumtime, node type, position, source)
+        sorted by decreasing tottime. If by is 'type' the data of all
+        nodes of each type is summed up and position and source are None.
+        """
+        rows = {}
+        for (expr, name, lexpos), (calls, tottime, cumtime) in self.stats.items():
+            if by == 'type':
+                key = (name, None, None)
+            else:
+                if lexpos is None:
+                    source = None
+                else:
+                    source = expr[lexpos:lexpos+30]
+                key = (name, lexpos, source)
+            row = rows.setdefault(key, [0, 0.0, 0.0])
+            row[0] += calls
+            row[1] += tottime
+            row[2] += cumtime
+        result = [tuple(totals) + group for group, totals in rows.items()]
+        result.sort(key=lambda row: row[1], reverse=True)
+        if limit:
+            result = result[:limit]
+        return result
+
+    def print_report(self, by='position', limit=20, stream=sys.stdout):
+        """Write the hot spot table to stream."""
+        stream.write('%9s %10s %10s  %-20s %5s  %s\n' % \
+                     ('calls', 'tottime', 'cumtime', 'node', 'pos', 'source'))
+        for calls, tottime, cumtime, name, lexpos, source in \
+            self.report(by, limit):
+            if lexpos is None:
+                lexpos = ''
+            if source is None:
+                source = ''
+            stream.write('%9d %10.4f %10.4f  %-20s %5s  %s\n' % \
+                         (calls, tottime, cumtime, name, lexpos, source))
+
+
+def main(argv=None):
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Format the records of the database and report '
+                    'the nodes of the expression where time is spent.')
+
+    # add the arguments
+    parser.add_argument(
+        'database', metavar='database.mst', help='.mst file to read')
+    parser.add_argument(
+        'expression', help='format expression to profile')
+    parser.add_argument(
+        '-c', '--config', default='',
+        help='configuration file (.ini) to load')
+    parser.add_argument(
+        '-n', '--count', type=int, default=0,
+        help='maximum number of records to format (default=ALL)')
+    parser.add_argument(
+        '-b', '--by', choices=['position', 'type'], default='position',
+        help='group by node position or by node type (default=position)')
+    parser.add_argument(
+        '-l', '--limit', type=int, default=20,
+        help='number of rows in the report (default=20)')
+
+    # parse the command line
+    args = parser.parse_args(argv)
+
+    import pyisis.config
+    from pyisis.engine import Engine
+    from pyisis.files import MasterFile
+
+    config = pyisis.config.config
+    if args.config:
+        config.load(args.config)
+    Engine.setup(config)
+    mst = MasterFile(args.database, config=config)
+    profiler = Profiler()
+    count = 0
+    start = time()
+    for record in mst:
+        if record is None:
+            continue
+        if args.count and count >= args.count:
+            break
+        pyisis.session.format(args.expression, record, mst=mst,
+                              profiler=profiler)
+        count += 1
+    elapsed = time() - start
+    sys.stdout.write('%d records formatted in %.3fs\n\n' % (count, elapsed))
+    profiler.print_report(args.by, args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -205,6 +205,10 @@ class MasterRecord(dict):
         self.mfbwb = 0  # backward pointer - block
         self.mfbwp = 0  # backward pointer - offset
 
+        # tags read from the master file when only some fields
+        # were loaded, None if the record is complete
+        self.loaded_tags = None
+
         # base  is computed on demand, and only
         # when a reference to the MasterFile is available
         # self.nvf -> number of fields in record
@@ -359,6 +363,9 @@ class MasterRecord(dict):
         newFlag = False
         modifiedFlag = False
 
+        if self.loaded_tags is not None:
+            raise Exception(_("Tried to save record read with only some of its fields."))
+
         # assume comfiguration of destination file
         self.config = mst.config
 
@@ -531,11 +538,13 @@ class MasterRecord(dict):
         return pyisis.session.format(expr, self)
     pft = format
 
-    def read(self, mst):
+    def read(self, mst, tags=None):
         """ Parse the contents of the master file, filling the associated
         data structures. File descriptor (fd) must be at the correct position
         (start of a new record). The parameter mst is a reference to the
         MasterFile instance.
+        If tags is given, only the fields with those tags are decoded and
+        the record is flagged as partial, so it can not be saved.
         """
         def load_data():
             fd = mst.mst_fd
@@ -581,7 +590,22 @@ class MasterRecord(dict):
                 pairs.append((tag & 0xffff , value))
             return pairs
 
-        pairs = prepare_tagval_list()
+        def prepare_selected_tagval_list():
+            pairs = []
+            for entry in range(0, len(whole_dir), 3):
+                tag, pos, length = whole_dir[entry:entry+3]
+                tag = tag & 0xffff
+                if tag in tags:
+                    value = raw_data[pos:pos+length]
+                    pairs.append((tag, value.decode(input_encoding)))
+            return pairs
+
+        if tags is None:
+            pairs = prepare_tagval_list()
+        else:
+            tags = frozenset(tags)
+            pairs = prepare_selected_tagval_list()
+            self.loaded_tags = tags
 
 
         def assemble_record(pairs):
@@ -11,6 +11,10 @@ __author__  = "Rodrigo Senra <rsenra@acm.org>"
 
 import sys
 import re
+import os
+import cPickle
+from hashlib import sha1
+from tempfile import mkstemp
 import pyisis.ast
 import pyisis.lexer
 import pyisis.parser
@@ -22,6 +26,12 @@ include_pat = re.compile(r"@[\w\d\.\/]+")
 # Maps expressions to formatting functions
 _cache = {}
 
+# Version of the chains pickled in FORMAT_CACHE_DIR. Bump it whenever
+# the grammar or the state of the node classes changes, so that chains
+# compiled by older code are never unpickled into the new classes.
+CHAIN_CACHE_VERSION = 2
+
+
 class Session(object):
     def __init__(self, config):
         self.lexer = pyisis.lexer.PftLexer()
@@ -30,6 +40,8 @@ class Session(object):
                                               outputdir=config.PARSER_AUXFILES_DIR)
         self.compiler = pyisis.ast.PftCompiler()
         self.config = config
+        # MasterFiles opened by ref() calls, reused between records
+        self.mst_pool = {}
 
 # create a default session
 session = None
@@ -40,36 +52,15 @@ def initialize(config):
     global session
     session = Session(config)
 
-def format(expr, record, session=None, mst=None, debug=False):
-    """ Apply the formatting function resulting from the compilation
-    of expression over the pair (mst,record).
-    Every formatting function is saved in a cache to avoid recompilation
-    in the future.
+def expand_includes(expr, mst):
+    """Replace every include (@file) directive in expr by the contents
+    of the respective file, searching first relative to the current
+    directory and then relative to the directory of the master file.
     """
-    # clear heading and trailing spaces
-    # they are meaningless, but if present could break the grammar
-    expr = expr.strip()
-
-    if session is None:
-        session = pyisis.session.session
-
-    if mst is None:
-        if record.mst is not None:
-            # Check if record has mst field set
-            mst = record.mst
-        else:
-            # If no mst given, create a dummy with default configuration
-            class DummyMst(object):
-                def __init__(self):
-                    self.config = session.config
-            mst = DummyMst()
-
-    # expand include (@) expressions
     # These should be expanded  before checking the cache,
     # in order to the expanded version of the expression to
     # be the one cached. In this way, if the content of the file
     # changes the cache will behave as expected.
-    #------Preprocessing
     while 1:
         # loop needed to handle include inside include
         includes = include_pat.findall(expr)
@@ -92,16 +83,78 @@ def format(expr, record, session=None, mst=None, debug=False):
                     raise Exception (_('Include file error'))
             else:
                 raise Exception (_('File %s not found' % includefile))
-        #DEBUG
-        #try:
-        #    del _cache[expr]
-        #except KeyError:
-        #    pass
-    
+    return expr
+
+
+def _chain_cache_path(expr, cachedir):
+    """Name of the file that holds the compiled chain of expr
+    inside the on-disk cache directory.
+    """
+    if type(expr) is unicode:
+        expr = expr.encode('utf-8')
+    version = "%d:%d" % (CHAIN_CACHE_VERSION, cPickle.HIGHEST_PROTOCOL)
+    key = sha1(version + "\0" + expr).hexdigest()
+    return join(cachedir, key + ".pft")
+
+
+def load_chain(expr, cachedir):
+    """Return the flattened chain previously stored for expr
+    in cachedir or None if it is not available.
+    The entry is unpickled, which can run arbitrary code, so
+    cachedir must only be writable by trusted users.
+    """
+    try:
+        fd = open(_chain_cache_path(expr, cachedir), "rb")
+    except IOError:
+        return None
+    try:
+        try:
+            return cPickle.load(fd)
+        except Exception:
+            # truncated or stale entry, recompile it
+            return None
+    finally:
+        fd.close()
+
+
+def store_chain(expr, chain, cachedir):
+    """Save the flattened chain of expr in cachedir. The entry is
+    written to a temporary file and then renamed, so that concurrent
+    processes never read a partially written chain.
+    """
+    try:
+        if not exists(cachedir):
+            os.makedirs(cachedir)
+        handle, tmpname = mkstemp(dir=cachedir, suffix=".tmp")
+        fd = os.fdopen(handle, "wb")
+        try:
+            cPickle.dump(chain, fd, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            fd.close()
+        os.rename(tmpname, _chain_cache_path(expr, cachedir))
+    except (IOError, OSError, cPickle.PicklingError):
+        # the disk cache is an optimization, never a requirement
+        pass
+
+
+def get_formatter(expr, session, mst, debug=False):
+    """Return the formatting function for the (already expanded)
+    expression, compiling it if necessary. Compiled functions are
+    kept in the process cache and, if FORMAT_CACHE_DIR is set,
+    the parsed chains are also shared on disk between processes.
+    """
     try:
         # look up function in the cache of pre-compiled expressions
-        formatter = _cache[expr]
+        return _cache[expr]
     except KeyError:
+        pass
+
+    cachedir = getattr(mst.config, 'FORMAT_CACHE_DIR', '')
+    chain = None
+    if cachedir and not debug:
+        chain = load_chain(expr, cachedir)
+
+    if chain is None:
         # generate another formatting function
         if debug:
             print "TOK:\n"
@@ -116,17 +169,132 @@ def format(expr, record, session=None, mst=None, debug=False):
         if debug:
             print "CHAIN:\n", chain
 
-        formatter = session.compiler.compile_code(chain)
+        # chains must be stored before their first evaluation
+        # because nodes keep state while formatting
+        if cachedir and not debug:
+            store_chain(expr, chain, cachedir)
+
+    formatter = session.compiler.compile_code(chain)
 
-        # add newly created function to the cache
-        if not debug:
-            _cache[expr] = formatter
+    # add newly created function to the cache
+    if not debug:
+        _cache[expr] = formatter
+    return formatter
+
+
+def required_tags(expr, session=None, mst=None):
+    """Return the set of field tags the expression reads from the
+    formatted record, or None if the whole record may be needed.
+    """
+    expr = expr.strip()
+    if session is None:
+        session = pyisis.session.session
+    if mst is None:
+        mst = _record_mst(None, mst, session)
+    formatter = get_formatter(expand_includes(expr, mst), session, mst)
+    return formatter.required_tags
+
+
+def _record_mst(record, mst, session):
+    """Return the master file to be used while formatting record."""
+    if mst is None:
+        if record is not None and record.mst is not None:
+            # Check if record has mst field set
+            mst = record.mst
+        else:
+            # If no mst given, create a dummy with default configuration
+            class DummyMst(object):
+                def __init__(self):
+                    self.config = session.config
+            mst = DummyMst()
+    return mst
+
+
+def format(expr, record, session=None, mst=None, debug=False, profiler=None):
+    """ Apply the formatting function resulting from the compilation
+    of expression over the pair (mst,record).
+    Every formatting function is saved in a cache to avoid recompilation
+    in the future.
+    If a pyisis.profiler.Profiler is given, the time spent in each node
+    of the expression is added to it.
+    """
+    # clear heading and trailing spaces
+    # they are meaningless, but if present could break the grammar
+    expr = expr.strip()
+
+    if session is None:
+        session = pyisis.session.session
+
+    mst = _record_mst(record, mst, session)
+
+    # expand include (@) expressions
+    expr = expand_includes(expr, mst)
+    formatter = get_formatter(expr, session, mst, debug)
 
     lw = mst.config.MAX_LINE_WIDTH
-    result = formatter(rec=record, mst=mst, debug=debug)
+    if profiler is None:
+        result = formatter(rec=record, mst=mst, debug=debug,
+                           mst_pool=session.mst_pool)
+    else:
+        profiler.start(expr)
+        try:
+            result = formatter(rec=record, mst=mst, debug=debug,
+                               mst_pool=session.mst_pool)
+        finally:
+            profiler.stop()
     sys.stdout.flush()
     mst.config.MAX_LINE_WIDTH = lw
     return result.encode(mst.config.OUTPUT_ENCODING)
 
 # create alias for function
 pft=format
+
+
+def iterformat(expr, records, session=None, mst=None, batch_size=100):
+    """Generator that applies format(expr, record) to each record of
+    the given iterable. Records are formatted in batches of batch_size:
+    before a batch is formatted, every record it references in other
+    databases through ref() is read at once, in the physical order of
+    the target master file.
+    """
+    expr = expr.strip()
+    if session is None:
+        session = pyisis.session.session
+
+    def format_batch(batch):
+        batch_mst = _record_mst(batch[0], mst, session)
+        formatter = get_formatter(expand_includes(expr, batch_mst),
+                                  session, batch_mst)
+        pyisis.ast.prefetch_refs(formatter.chain, batch, batch_mst,
+                                 session.mst_pool)
+        for record in batch:
+            yield format(expr, record, session, mst)
+
+    batch = []
+    for record in records:
+        if record is None:
+            # inexistent records in the master file are skipped
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            for result in format_batch(batch):
+                yield result
+            batch = []
+    if batch:
+        for result in format_batch(batch):
+            yield result
+
+
+def format_to(stream, expr, records, session=None, mst=None, batch_size=100):
+    """Apply format(expr, record) to each record of the given iterable,
+    writing the encoded output of every record to the file-like stream
+    as soon as it is formatted. Only one batch of records is held in
+    memory at a time, so whole databases can be printed without
+    building the report first.
+    Return the number of records written.
+    """
+    count = 0
+    for result in iterformat(expr, records, session, mst, batch_size):
+        stream.write(result)
+        count += 1
+    return count
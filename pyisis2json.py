@@ -7,6 +7,7 @@ from pyisis.fields import MasterField
 from pyisis.fields import MasterContainerField
 from pyisis.engine import Engine
 import pyisis
+from index.techniques import document_keys
 
 """
 
@@ -20,13 +21,83 @@ DEFAULT_QTY = sys.maxint
 ISIS_MFN_KEY = 'mfn'
 ISIS_ACTIVE_KEY = 'active'
 master_file_name = 'isis%scds.mst'%os.sep
+# JSON libraries, fastest first; json is always available
+ENCODERS = ('orjson', 'ujson', 'json')
+# bytes kept by BufferedOutput before each write to the file
+BUFFER_SIZE = 1 << 20
+# records per row group of the Parquet output
+ROW_GROUP_SIZE = 10000
+# struct field of the text before the first subfield
+PARQUET_TEXT_KEY = '_'
 
-def iterRecords(master_file_name):
+def jsonEncoder(name):
+    """Return the function encoding a document to a UTF-8 JSON str
+    with the named library. Raises ImportError if it is not installed"""
+    if name == 'orjson':
+        import orjson
+        return orjson.dumps
+    if name == 'ujson':
+        import ujson
+        return ujson.dumps
+    return json.JSONEncoder(check_circular=False).encode
+
+def fastestEncoder():
+    """Return the name of the fastest JSON library installed"""
+    for name in ENCODERS:
+        try:
+            jsonEncoder(name)
+        except ImportError:
+            continue
+        return name
+
+def bsonEncoder():
+    """Return the function encoding a document to BSON, the format
+    of the .bson files read by mongorestore"""
+    import bson
+    # bson.encode is new in pymongo 3.9, BSON.encode is gone in 4.0
+    return getattr(bson, 'encode', None) or bson.BSON.encode
+
+class BufferedOutput(object):
+    """Joins the strings written into chunks of about size bytes,
+    written to the file with a single call"""
+    def __init__(self, file, size=BUFFER_SIZE):
+        self.file = file
+        self.size = size
+        self.parts = []
+        self.length = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.length += len(data)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.file.write(''.join(self.parts))
+            self.parts = []
+            self.length = 0
+
+def openMasterFile(master_file_name):
     config = pyisis.config.config
     config.load("isis/cds.ini")
     Engine.setup(config)
-    mst = MasterFile(master_file_name, config=config)
-    for record in mst:
+    return MasterFile(master_file_name, config=config)
+
+def iterRecords(master_file_name, tags=None):
+    """Generate the active records as dicts, mapping each tag to the
+    list of its occurrences, one dict of subfields per occurrence
+
+    >>> record = iterRecords(master_file_name, [30]).next()
+    >>> len(record['30']), sorted(record['30'][0])
+    (1, ['_', u'a', u'b'])
+    >>> record['_id'] = record[ISIS_MFN_KEY]
+    >>> [(text, tf) for id, field, text, tf, length
+    ...  in document_keys(record) if text == 'P. 211-224']
+    [('P. 211-224', 1)]
+    """
+    mst = openMasterFile(master_file_name)
+    for record in mst.iterrecords(tags):
         fields = {}
         if SKIP_INACTIVE and (record.status != 0): 
             continue
@@ -44,25 +115,50 @@ def iterRecords(master_file_name):
                 else:   
                     subfield_occurrences = subfields.setdefault(subfield_key,[])
                     subfield_occurrences.append(field._get_subfields(field.data)[key])
-                field_occurrences.append(subfields)
+            field_occurrences.append(subfields)
         yield fields
             
-def writeJsonArray(master_file_name, output, qty, skip, id_tag, gen_uuid, mongo, mfn):
+def writeIndexKeys(record, index_output, encode=json.dumps):
+    """Write the index collection documents of the record,
+    one JSON object per line"""
+    for id, field, text, tf, length in document_keys(record):
+        index_output.write(encode({'cds_id':id, 'field':field, 'text':text,
+                                   'tf':tf, 'length':length}))
+        index_output.write('\n')
+
+def writeJsonArray(master_file_name, output, qty, skip, id_tag, gen_uuid, mongo, mfn,
+                   tags=None, index_output=None, encoder='json', bson=False):
+    """Write the records as a JSON array, or one per line if mongo
+    is True, or as BSON documents if bson is True. The writes to
+    output and index_output are buffered and flushed before returning"""
     start = skip
     end = start + qty
+    encode = jsonEncoder(encoder)
+    if bson:
+        encode_record = bsonEncoder()
+        mongo = True
+    else:
+        encode_record = encode
+    output = BufferedOutput(output)
+    if index_output is not None:
+        index_output = BufferedOutput(index_output)
     if not mongo:
         output.write('[\n')
+    if tags is not None and id_tag:
+        tags = set(tags)
+        tags.add(id_tag)
     if id_tag:
         id_tag = str(id_tag)
         ids = set()
     else:
         id_tag = ''    
-    for i, record in enumerate(iterRecords(master_file_name)):
+    for i, record in enumerate(iterRecords(master_file_name, tags)):
         if i >= end: 
             break
         if i > start and not mongo:
             output.write(',')
-        output.write('\n')
+        if not bson:
+            output.write('\n')
         if start <= i < end:
             if id_tag:
                 occurrences = record.get(id_tag, None)
@@ -83,11 +179,141 @@ def writeJsonArray(master_file_name, output, qty, skip, id_tag, gen_uuid, mongo,
                 record['_id'] = unicode(uuid4())
             elif mfn:
                 record['_id'] = record[ISIS_MFN_KEY]
-            output.write(json.dumps(record).encode('utf-8'))
+            output.write(encode_record(record))
+            if index_output is not None:
+                writeIndexKeys(record, index_output, encode)
     if not mongo:
         output.write('\n]')
+    if not bson:
+        output.write('\n')
+    output.flush()
+    if index_output is not None:
+        index_output.flush()
+
+def iterActive(mst, qty, skip, tags=None):
+    """Generate the qty active records of mst after the first skip"""
+    count = 0
+    for record in mst.iterrecords(tags):
+        if record is None or record.status != 0:
+            continue
+        if count >= skip + qty:
+            break
+        if count >= skip:
+            yield record
+        count += 1
+
+def iterOccurrences(record, delimiter):
+    """Generate the pairs (tag, subfields) of the fields of the record,
+    subfields mapping each code to the list of its values, in order.
+    Unlike MasterField._get_subfields, repeated codes keep every value"""
+    for field in record:
+        data = field.data
+        if not data.startswith(delimiter):
+            data = delimiter + u" " + data
+        subfields = {}
+        for part in data.split(delimiter):
+            if part:
+                code = part[0].lower().strip() or PARQUET_TEXT_KEY
+                subfields.setdefault(code, []).append(part[1:])
+        yield field.tag, subfields
+
+def profileLayout(fields, tags=None):
+    """Return the dict tag -> {code: repeated} of the subfields in the
+    FieldProfile of each tag, repeated is True for the codes found more
+    than once in an occurrence"""
+    layout = {}
+    for tag, field in fields.iteritems():
+        if tags is None or tag in tags:
+            layout[tag] = dict(((code or PARQUET_TEXT_KEY),
+                                code in field.repeated_subfields)
+                               for code in field.subfields)
+    return layout
+
+def writeProfile(master_file_name, output):
+    """Write the statistics of each tag gathered by MasterFile.profile()
+    as a JSON document"""
+    records, fields = openMasterFile(master_file_name).profile()
+    report = {}
+    for tag, field in fields.iteritems():
+        report[str(tag)] = {
+            'records': field.records,
+            'occurrences': field.occurrences,
+            'max_repeat': field.max_repeat,
+            'mean_length': round(field.mean_length, 1),
+            'max_length': field.max_length,
+            'lengths': dict((str(bucket), count) for bucket, count
+                            in field.lengths.iteritems()),
+            'subfields': sorted(field.subfields),
+            'repeated_subfields': sorted(field.repeated_subfields)}
+    output.write(json.dumps({'records': records, 'fields': report},
+                            indent=1, sort_keys=True))
     output.write('\n')
 
+def parquetModules():
+    """Return the pair of modules (pyarrow, pyarrow.parquet). Raises
+    ImportError if pyarrow is not installed"""
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow, pyarrow.parquet
+
+def parquetSchema(layout):
+    """Return the Arrow schema of the records: the mfn and a column
+    per tag holding the list of occurrences, each a struct of the
+    subfield codes of the tag"""
+    pa = parquetModules()[0]
+    columns = [pa.field(ISIS_MFN_KEY, pa.int64())]
+    for tag in sorted(layout):
+        codes = layout[tag]
+        struct = pa.struct([pa.field(code, codes[code] and
+                                     pa.list_(pa.string()) or pa.string())
+                            for code in sorted(codes)])
+        columns.append(pa.field(str(tag), pa.list_(struct)))
+    return pa.schema(columns)
+
+def writeParquet(master_file_name, output, qty, skip, tags=None,
+                 row_group_size=ROW_GROUP_SIZE):
+    """Write the records as a Parquet dataset, row_group_size records
+    per row group. The tags and subfield codes of the columns are
+    those found by MasterFile.profile()"""
+    pa, pq = parquetModules()
+    mst = openMasterFile(master_file_name)
+    delimiter = mst.config.SUBFIELD_DELIMITER
+    fields = mst.profile()[1]
+    layout = profileLayout(fields, tags)
+    schema = parquetSchema(layout)
+    tags = sorted(layout)
+    writer = pq.ParquetWriter(output, schema)
+
+    def writeRowGroup(mfns, columns):
+        arrays = [pa.array(mfns, type=schema[0].type)]
+        for idx, tag in enumerate(tags):
+            arrays.append(pa.array(columns[tag], type=schema[idx + 1].type))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    mfns = []
+    columns = dict((tag, []) for tag in tags)
+    for record in iterActive(mst, qty, skip, tags):
+        mfns.append(record.mfn)
+        row = dict((tag, None) for tag in tags)
+        for tag, subfields in iterOccurrences(record, delimiter):
+            codes = layout[tag]
+            occurrence = dict.fromkeys(codes)
+            for code, values in subfields.iteritems():
+                occurrence[code] = codes[code] and values or values[0]
+            occurrences = row[tag]
+            if occurrences is None:
+                occurrences = row[tag] = []
+            occurrences.append(occurrence)
+        for tag in tags:
+            columns[tag].append(row[tag])
+        if len(mfns) >= row_group_size:
+            writeRowGroup(mfns, columns)
+            mfns = []
+            columns = dict((tag, []) for tag in tags)
+    if mfns:
+        writeRowGroup(mfns, columns)
+    writer.close()
+
 if __name__ == '__main__':
 
     # create the parser
@@ -130,16 +356,80 @@ if __name__ == '__main__':
         '-m', '--mongo', const=True, action='store_const',
         help='output individual records as JSON dictionaries, one per line'
              'for bulk insert to MongoDB via mongoimport utility')
+    parser.add_argument(
+        '-B', '--bson', const=True, action='store_const',
+        help='output the records as BSON documents, for bulk insert '
+             'to MongoDB via mongorestore utility (requires pymongo)')
+    parser.add_argument(
+        '-P', '--parquet', const=True, action='store_const',
+        help='output the records as a Parquet dataset with a column per '
+             'tag, each a list of occurrences with the subfields as struct '
+             'fields (requires pyarrow and -o)')
+    parser.add_argument(
+        '-p', '--profile', const=True, action='store_const',
+        help='output only the statistics of each tag as a JSON document: '
+             'occurrences, repetitions, lengths and subfield codes')
+    parser.add_argument(
+        '-g', '--row-group', type=int, default=ROW_GROUP_SIZE,
+        metavar='RECORDS',
+        help='records per row group of the Parquet output '
+             '(default=%d)' % ROW_GROUP_SIZE)
+    parser.add_argument(
+        '-e', '--encoder', choices=ENCODERS, default=fastestEncoder(),
+        help='JSON library used for the output '
+             '(default=fastest installed, now %(default)s)')
+    parser.add_argument(
+        '-t', '--tags', metavar='TAG[,TAG...]',
+        help='comma separated field tags to export, other fields '
+             'are not decoded (default=ALL)')
+    parser.add_argument(
+        '-x', '--index-out', type=argparse.FileType('w'), metavar='INDEX.json',
+        help='also write the documents of the index collection (techniques '
+             '0, 2 and 4), one per line for mongoimport or isis-mongo-index.py; '
+             'requires -i, -n or -u')
     
     # parse the command line
     args = parser.parse_args()
-    if args.bulk:
-        args.out.write('{ "docs" : ')
-    writeJsonArray(args.master_file_name, args.out, args.qty, args.skip, 
-        args.id, args.uuid, args.mongo, args.mfn)
-    if args.bulk:
-        args.out.write('}\n')
+    if args.index_out and not (args.id or args.mfn or args.uuid):
+        parser.error('--index-out requires an "_id" from -i, -n or -u')
+    if args.bson and args.bulk:
+        parser.error('--bson output can not be sent to CouchDB')
+    if (args.parquet or args.profile) and (args.bulk or args.mongo or
+                                           args.bson or args.index_out):
+        parser.error('--parquet and --profile can not be combined '
+                     'with -b, -m, -B or -x')
+    if args.parquet and args.profile:
+        parser.error('--parquet and --profile are exclusive')
+    if args.parquet and args.out is sys.stdout:
+        parser.error('--parquet requires an output file given with -o')
+    try:
+        if args.parquet:
+            parquetModules()
+        if args.bson:
+            bsonEncoder()
+        jsonEncoder(args.encoder)
+    except ImportError, ex:
+        parser.error(str(ex))
+    if args.tags:
+        tags = [int(tag) for tag in args.tags.split(',') if tag]
+    else:
+        tags = None
+    if args.profile:
+        writeProfile(args.master_file_name, args.out)
+    elif args.parquet:
+        writeParquet(args.master_file_name, args.out, args.qty, args.skip,
+                     tags, args.row_group)
+    else:
+        if args.bulk:
+            args.out.write('{ "docs" : ')
+        writeJsonArray(args.master_file_name, args.out, args.qty, args.skip, 
+            args.id, args.uuid, args.mongo, args.mfn, tags, args.index_out,
+            args.encoder, bool(args.bson))
+        if args.bulk:
+            args.out.write('}\n')
     args.out.close()
+    if args.index_out:
+        args.index_out.close()
 
     
     
\ No newline at end of file
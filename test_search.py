@@ -1,25 +1,89 @@
 #!/usr/bin/env python
-import pymongo, re
-import sys
-
-term  = (sys.argv[1]).upper()
-try:
-    field = sys.argv[2]
-except:
-    field = None
-mongo = pymongo.Connection("localhost", 27017)
-db = mongo.bireme
-tot = 0
-
-if field == None:
-    for i in db.index.find({'text':{'$regex':'^%s'%term}},{"cds_id":True}):
-        for d in db.cds.find({"_id":i['cds_id']}):
+import argparse
+
+import pymongo
+
+from index.search import search, ensure_indexes, DEFAULT_PAGE_SIZE
+from index.ranking import ranked_search
+from index.query import boolean_search, QueryError
+
+"""
+
+Search the index collection for the keys starting with a term,
+optionally in a single field, and print the documents found,
+or only the most relevant ones with --rank. With --boolean the term
+is a query in the syntax of CDS/ISIS, like
+    MEASUREMENT * INSTRUMENTS/(69)
+
+"""
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 27017
+DEFAULT_DB = 'bireme'
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Print the documents with keys starting with a term')
+
+    # add the arguments
+    parser.add_argument(
+        'term', help='beginning of the keys searched')
+    parser.add_argument(
+        'field', nargs='?', default=None,
+        help='search only the keys of this field')
+    parser.add_argument(
+        '--host', default=DEFAULT_HOST,
+        help='MongoDB host (default=%s)' % DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help='MongoDB port (default=%d)' % DEFAULT_PORT)
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help='database name (default=%s)' % DEFAULT_DB)
+    parser.add_argument(
+        '-p', '--page', type=int, default=DEFAULT_PAGE_SIZE,
+        help='documents read per query (default=%d)' % DEFAULT_PAGE_SIZE)
+    parser.add_argument(
+        '-b', '--boolean', const=True, action='store_const',
+        help='the term is a boolean query: * (and), + (or), ^ (and not), '
+             'TERM/(TAGS) and TERM$ (keys starting with TERM)')
+    parser.add_argument(
+        '-c', '--compact', const=True, action='store_const',
+        help='read the keys from the postings collection, built by '
+             'isis-mongo-postings.py')
+    parser.add_argument(
+        '-r', '--rank', type=int, default=0, metavar='N',
+        help='print only the N most relevant documents, with their scores')
+
+    # parse the command line
+    args = parser.parse_args()
+    db = pymongo.MongoClient(args.host, args.port)[args.db]
+    ensure_indexes(db)
+    if args.boolean and (args.rank or args.field):
+        parser.error('--boolean queries give the fields with /(TAGS) '
+                     'and can not be ranked')
+    if args.compact and args.rank:
+        parser.error('--compact searches can not be ranked')
+    tot = 0
+    if args.boolean:
+        try:
+            for d in boolean_search(db, args.term, args.page,
+                                    bool(args.compact)):
+                tot += 1
+                print d
+        except QueryError, ex:
+            parser.error('invalid query: %s' % ex)
+    elif args.rank:
+        for score, d in ranked_search(db, args.term, args.field, args.rank,
+                                      args.page):
             tot += 1
-            print d
-else:
-    for i in db.index.find({'text':{'$regex':'^%s'%term},"field":field},{"cds_id":True}):
-        for d in db.cds.find({"_id":i['cds_id']}):
+            print '%.4f' % score, d
+    else:
+        for d in search(db, args.term, args.field, args.page,
+                        compact=bool(args.compact)):
             tot += 1
             print d
-            
-print "total = %s"%str(tot) 
+
+    print "total = %s"%str(tot)
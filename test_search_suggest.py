@@ -1,15 +1,72 @@
 #!/usr/bin/env python
-import pymongo, re
-import sys
-
-term  = (sys.argv[1]).upper()
-
-mongo = pymongo.Connection("localhost", 27017)
-db = mongo.bireme
-l = []
-for i in db.index.find({'text':{'$regex':'^%s'%term}},{"text":True}):
-    if not i["text"] in l:
-        l.append(i["text"])
-l.sort()
-    
-for x in l: print x
\ No newline at end of file
+import argparse
+
+import pymongo
+
+from index.search import browse_terms, ensure_indexes, DEFAULT_BROWSE_SIZE
+
+"""
+
+Browse the dictionary of the index collection like the dictionary
+of WinISIS: print the distinct keys starting with a term, in sorted
+order, a page at a time.
+
+"""
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 27017
+DEFAULT_DB = 'bireme'
+
+if __name__ == '__main__':
+
+    # create the parser
+    parser = argparse.ArgumentParser(
+        description='Print the distinct keys starting with a term')
+
+    # add the arguments
+    parser.add_argument(
+        'term', help='beginning of the keys')
+    parser.add_argument(
+        '--host', default=DEFAULT_HOST,
+        help='MongoDB host (default=%s)' % DEFAULT_HOST)
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT,
+        help='MongoDB port (default=%d)' % DEFAULT_PORT)
+    parser.add_argument(
+        '-d', '--db', default=DEFAULT_DB,
+        help='database name (default=%s)' % DEFAULT_DB)
+    parser.add_argument(
+        '-f', '--field', default=None,
+        help='browse only the keys of this field')
+    parser.add_argument(
+        '-n', '--number', type=int, default=DEFAULT_BROWSE_SIZE,
+        help='keys per page (default=%d)' % DEFAULT_BROWSE_SIZE)
+    parser.add_argument(
+        '-a', '--after', default=None,
+        help='resume the browse after this key')
+    parser.add_argument(
+        '-p', '--pages', type=int, default=0,
+        help='maximum number of pages (default=ALL)')
+    parser.add_argument(
+        '-c', '--count', const=True, action='store_const',
+        help='print the number of keys of each text')
+
+    # parse the command line
+    args = parser.parse_args()
+    db = pymongo.MongoClient(args.host, args.port)[args.db]
+    ensure_indexes(db)
+    after = args.after
+    pages = 0
+    while True:
+        terms, after = browse_terms(db, args.term, args.number, args.field,
+                                    after, prefix=True)
+        for text, count in terms:
+            if args.count:
+                print text, count
+            else:
+                print text
+        pages += 1
+        if after is None or (args.pages and pages >= args.pages):
+            break
+    if after is not None:
+        print "next page: --after %s" % after